@@ -0,0 +1,399 @@
+import asyncio
+import json
+import random
+import statistics
+import time
+from math import ceil
+from urllib.parse import quote
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from .pagination import RecipePagination
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+SCENARIOS = {}
+
+# Сколько секунд ждать ответа сервера при нагрузочном прогоне.
+LOAD_TIMEOUT = 30
+
+
+def scenario(name):
+    """Регистрирует сценарий замера под указанным именем.
+
+    Сценарий получает генератор случайных чисел и возвращает список
+    кортежей (подпись, url, пользователь). Для анонимного запроса
+    пользователь равен None.
+    """
+
+    def decorator(func):
+        SCENARIOS[name] = func
+        return func
+
+    return decorator
+
+
+def get_client(user=None):
+    host = next(
+        (host for host in settings.ALLOWED_HOSTS if host != "*"), "localhost"
+    )
+    if user is None:
+        return Client(HTTP_HOST=host)
+    token, _ = Token.objects.get_or_create(user=user)
+    return Client(HTTP_HOST=host, HTTP_AUTHORIZATION=f"Token {token.key}")
+
+
+def measure(client, url, repeat):
+    """Выполняет запрос repeat раз и возвращает задержки в миллисекундах
+    и число SQL-запросов на один запрос.
+
+    Первый, прогревочный, запрос в замер не входит.
+    """
+
+    durations = []
+    for attempt in range(repeat + 1):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = client.get(url)
+            if response.streaming:
+                b"".join(response.streaming_content)
+            duration = (time.perf_counter() - start) * 1000
+        if response.status_code >= 400:
+            raise ValueError(f"{url} вернул {response.status_code}")
+        if attempt:
+            durations.append(duration)
+    return durations, len(queries)
+
+
+def get_busiest_user(relation):
+    """Пользователь с наибольшим числом связанных объектов."""
+
+    return (
+        User.objects.annotate(total=Count(relation))
+        .order_by("-total", "id")
+        .first()
+    )
+
+
+def summarize(durations):
+    """Возвращает p50, p95 и p99 для списка задержек."""
+
+    if len(durations) < 2:
+        return durations * 3
+    percentiles = statistics.quantiles(durations, n=100)
+    return percentiles[49], percentiles[94], percentiles[98]
+
+
+@scenario("ingredients")
+def ingredient_search(rng):
+    names = list(
+        Ingredient.objects.filter(name__regex=r"^\w{5}").values_list(
+            "name", flat=True
+        )[:500]
+    )
+    urls = []
+    for length in (1, 2, 5):
+        for name in rng.sample(names, min(len(names), 5)):
+            urls.append(
+                (
+                    f"ingredients search[:{length}]",
+                    f"/api/ingredients/?search={name[:length]}",
+                    None,
+                )
+            )
+    return urls
+
+
+@scenario("recipe_tags")
+def recipe_tag_filter(rng):
+    slugs = list(Tag.objects.values_list("slug", flat=True))
+    urls = [("recipes no tags", "/api/recipes/", None)]
+    for count in range(1, min(len(slugs), 3) + 1):
+        query = "&".join(f"tags={slug}" for slug in rng.sample(slugs, count))
+        urls.append(
+            (f"recipes {count} tags", f"/api/recipes/?{query}", None)
+        )
+    return urls
+
+
+@scenario("recipes")
+def recipe_list(rng):
+    user = get_busiest_user("favorites")
+    count = Recipe.objects.count()
+    last_page = max(ceil(count / RecipePagination.page_size), 1)
+    # Автор случайного рецепта: авторы с большим числом рецептов
+    # выбираются чаще.
+    author_id = Recipe.objects.order_by("id").values_list(
+        "author", flat=True
+    )[rng.randrange(count)]
+    return [
+        ("recipes page 1", "/api/recipes/", None),
+        ("recipes page 1 auth", "/api/recipes/", user),
+        ("recipes last page", f"/api/recipes/?page={last_page}", None),
+        ("recipes author", f"/api/recipes/?author={author_id}", None),
+        ("recipes favorited", "/api/recipes/?is_favorited=1", user),
+        ("recipes in cart", "/api/recipes/?is_in_shopping_cart=1", user),
+    ]
+
+
+@scenario("recipe_detail")
+def recipe_detail(rng):
+    ids = list(Recipe.objects.order_by("id").values_list("id", flat=True))
+    user = get_busiest_user("favorites")
+    urls = []
+    for recipe_id in rng.sample(ids, min(len(ids), 5)):
+        urls.append(("recipe detail", f"/api/recipes/{recipe_id}/", None))
+        urls.append(("recipe detail auth", f"/api/recipes/{recipe_id}/", user))
+    return urls
+
+
+@scenario("subscriptions")
+def subscriptions(rng):
+    user = get_busiest_user("subscribes")
+    return [
+        ("subscriptions", "/api/users/subscriptions/", user),
+        (
+            "subscriptions recipes_limit=3",
+            "/api/users/subscriptions/?recipes_limit=3",
+            user,
+        ),
+    ]
+
+
+@scenario("shopping_cart")
+def shopping_cart(rng):
+    user = get_busiest_user("shopping_cart")
+    url = "/api/recipes/download_shopping_cart/"
+    return [
+        (f"shopping cart {extension}", f"{url}?format={extension}", user)
+        for extension in ("txt", "csv", "json")
+    ]
+
+
+def run(names, repeat, seed=0):
+    """Прогоняет сценарии и возвращает результаты, сгруппированные
+    по подписи запроса."""
+
+    rng = random.Random(seed)
+    clients = {}
+    results = {}
+    for name in names:
+        for label, url, user in SCENARIOS[name](rng):
+            key = user.id if user else None
+            if key not in clients:
+                clients[key] = get_client(user)
+            durations, queries = measure(clients[key], url, repeat)
+            result = results.setdefault(
+                label, {"durations": [], "queries": queries}
+            )
+            result["durations"].extend(durations)
+            result["queries"] = max(result["queries"], queries)
+    return results
+
+
+def get_load_requests(names, seed=0):
+    """Запросы сценариев для нагрузки на запущенный сервер: список
+    кортежей (подпись, url, заголовки)."""
+
+    rng = random.Random(seed)
+    requests = []
+    for name in names:
+        for label, url, user in SCENARIOS[name](rng):
+            headers = {}
+            if user is not None:
+                token, _ = Token.objects.get_or_create(user=user)
+                headers["Authorization"] = f"Token {token.key}"
+            requests.append((label, url, headers))
+    return requests
+
+
+async def read_response(reader):
+    """Читает ответ HTTP/1.1 целиком.
+
+    Возвращает код ответа и признак того, что сервер закрывает
+    соединение.
+    """
+
+    status = int((await reader.readline()).split()[1])
+    length, chunked, close = None, False, False
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        name, value = name.strip().lower(), value.strip().lower()
+        if name == "content-length":
+            length = int(value)
+        elif name == "transfer-encoding":
+            chunked = "chunked" in value
+        elif name == "connection":
+            close = value == "close"
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    elif length is not None:
+        await reader.readexactly(length)
+    else:
+        await reader.read()
+        close = True
+    return status, close
+
+
+async def load_connection(address, requests, offset, deadline, results):
+    """Отправляет запросы по кругу, начиная с offset, пока не наступит
+    deadline, переоткрывая соединение, если сервер его закрыл."""
+
+    stream = None
+    position = offset
+    while time.perf_counter() < deadline:
+        label, raw = requests[position % len(requests)]
+        position += 1
+        result = results.setdefault(label, {"durations": [], "errors": 0})
+        start = time.perf_counter()
+        try:
+            if stream is None:
+                stream = await asyncio.open_connection(*address)
+            reader, writer = stream
+            writer.write(raw)
+            await writer.drain()
+            status, close = await asyncio.wait_for(
+                read_response(reader), LOAD_TIMEOUT
+            )
+        except (OSError, ValueError, IndexError, asyncio.TimeoutError,
+                asyncio.IncompleteReadError):
+            status, close = None, True
+        if status is None or status >= 400:
+            result["errors"] += 1
+        else:
+            result["durations"].append((time.perf_counter() - start) * 1000)
+        if close and stream is not None:
+            stream[1].close()
+            stream = None
+    if stream is not None:
+        stream[1].close()
+
+
+def run_load(address, requests, concurrency, duration):
+    """Нагружает сервер по адресу (host, port) запросами requests из
+    concurrency соединений в течение duration секунд.
+
+    Возвращает результаты по подписи запроса и фактическую длительность.
+    """
+
+    host = next(
+        (host for host in settings.ALLOWED_HOSTS if host != "*"), "localhost"
+    )
+    prepared = [
+        (
+            label,
+            "".join(
+                [f"GET {quote(url, safe='/?&=%')} HTTP/1.1\r\n"]
+                + [f"Host: {host}\r\n"]
+                + [f"{name}: {value}\r\n" for name, value in headers.items()]
+                + ["\r\n"]
+            ).encode(),
+        )
+        for label, url, headers in requests
+    ]
+
+    async def main():
+        results = {}
+        start = time.perf_counter()
+        deadline = start + duration
+        await asyncio.gather(
+            *(
+                load_connection(address, prepared, offset, deadline, results)
+                for offset in range(concurrency)
+            )
+        )
+        return results, time.perf_counter() - start
+
+    return asyncio.run(main())
+
+
+def make_load_report(results, elapsed):
+    """Сводка нагрузочного прогона: перцентили задержки в мс, успешные
+    запросы в секунду и число ошибок по каждому запросу и в сумме."""
+
+    report = {}
+    total = {"durations": [], "errors": 0}
+    for label, result in sorted(results.items()):
+        total["durations"].extend(result["durations"])
+        total["errors"] += result["errors"]
+        report[label] = summarize_load(result, elapsed)
+    report["total"] = summarize_load(total, elapsed)
+    return report
+
+
+def summarize_load(result, elapsed):
+    p50, p95, p99 = summarize(result["durations"]) or (0, 0, 0)
+    return {
+        "p50": round(p50, 3),
+        "p95": round(p95, 3),
+        "p99": round(p99, 3),
+        "rps": round(len(result["durations"]) / elapsed, 1),
+        "errors": result["errors"],
+    }
+
+
+def make_report(results):
+    """Сводка по каждому запросу: перцентили задержки в мс, SQL-запросы
+    на запрос и пропускная способность в запросах в секунду."""
+
+    report = {}
+    for label, result in results.items():
+        durations = result["durations"]
+        p50, p95, p99 = summarize(durations)
+        report[label] = {
+            "p50": round(p50, 3),
+            "p95": round(p95, 3),
+            "p99": round(p99, 3),
+            "queries": result["queries"],
+            "rps": round(len(durations) * 1000 / sum(durations), 1),
+        }
+    return report
+
+
+def save_baseline(path, report, meta):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(
+            {"meta": meta, "results": report},
+            file,
+            ensure_ascii=False,
+            indent=2,
+            sort_keys=True,
+        )
+
+
+def compare(report, path, tolerance):
+    """Сравнивает сводку с сохраненной базовой линией.
+
+    Регрессией считается рост p95 больше чем в (1 + tolerance) раз
+    или любой рост числа SQL-запросов. Возвращает список описаний
+    регрессий.
+    """
+
+    with open(path, encoding="utf-8") as file:
+        baseline = json.load(file)["results"]
+    regressions = []
+    for label, result in report.items():
+        expected = baseline.get(label)
+        if expected is None:
+            continue
+        if result["queries"] > expected["queries"]:
+            regressions.append(
+                f"{label}: SQL {expected['queries']} -> {result['queries']}"
+            )
+        if result["p95"] > expected["p95"] * (1 + tolerance):
+            regressions.append(
+                f"{label}: p95 {expected['p95']:.2f} -> {result['p95']:.2f} мс"
+            )
+    return regressions
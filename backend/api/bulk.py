@@ -0,0 +1,96 @@
+from django.conf import settings
+from rest_framework import serializers
+
+from users.models import User
+
+# Результаты пакетной операции для отдельного id.
+CREATED = "created"
+EXISTS = "exists"
+DELETED = "deleted"
+ABSENT = "absent"
+NOT_FOUND = "not_found"
+FORBIDDEN = "forbidden"
+
+
+class BulkIdsSerializer(serializers.Serializer):
+    """Список id для пакетной операции."""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_MAX_IDS,
+    )
+
+    def validate_ids(self, value):
+        return list(dict.fromkeys(value))
+
+
+def lock_user(user):
+    """Блокирует строку пользователя до конца транзакции, чтобы
+    одиночные и пакетные операции одного пользователя выполнялись
+    по очереди."""
+
+    list(User.objects.select_for_update().filter(id=user.id).values("id"))
+
+
+def add_relations(model, user, field, ids, targets, excluded=()):
+    """Создает связи пользователя с объектами из ids.
+
+    Связи создаются одним bulk_create(ignore_conflicts=True), поэтому
+    уже существующие пропускаются уникальным ограничением модели.
+    Возвращает список добавленных id и результат для каждого id.
+    Вызывается внутри транзакции.
+    """
+
+    lock_user(user)
+    found = set(
+        targets.filter(id__in=ids)
+        .exclude(id__in=excluded)
+        .values_list("id", flat=True)
+    )
+    existing = set(
+        model.objects.filter(
+            user=user, **{f"{field}__in": found}
+        ).values_list(field, flat=True)
+    )
+    added = [pk for pk in ids if pk in found and pk not in existing]
+    model.objects.bulk_create(
+        [model(user=user, **{field: pk}) for pk in added],
+        ignore_conflicts=True,
+    )
+    results = {}
+    for pk in ids:
+        if pk in excluded:
+            results[pk] = FORBIDDEN
+        elif pk not in found:
+            results[pk] = NOT_FOUND
+        else:
+            results[pk] = EXISTS if pk in existing else CREATED
+    return added, results
+
+
+def remove_relations(model, user, field, ids, before_delete=None):
+    """Удаляет связи пользователя с объектами из ids одним запросом.
+
+    before_delete вызывается со списком удаляемых id до удаления.
+    Возвращает список удаленных id и результат для каждого id.
+    Вызывается внутри транзакции.
+    """
+
+    lock_user(user)
+    relations = model.objects.filter(user=user, **{f"{field}__in": ids})
+    existing = set(relations.values_list(field, flat=True))
+    removed = [pk for pk in ids if pk in existing]
+    if removed:
+        if before_delete is not None:
+            before_delete(removed)
+        relations.delete()
+    return removed, {
+        pk: DELETED if pk in existing else ABSENT for pk in ids
+    }
+
+
+def bulk_response_data(ids, results):
+    """Тело ответа: результаты в порядке переданных id."""
+
+    return {"results": [{"id": pk, "status": results[pk]} for pk in ids]}
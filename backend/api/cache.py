@@ -0,0 +1,296 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags, urlencode
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+
+class ReferenceCache:
+    """Кэш готовых JSON-ответов для справочных данных.
+
+    Версия справочника хранится в общем кэше Django и меняется при
+    каждом изменении данных. Ответы кэшируются по версии сначала в общем
+    кэше, чтобы их видели все воркеры, а затем в памяти процесса.
+
+    Промах вычисляет один воркер (render_once), пока остальные ждут.
+    Блокировка берется через cache.add, поэтому между воркерами она
+    работает только с бэкендом, где add атомарен (Redis, Memcached).
+    С LocMemCache ответ вычисляется однократно внутри процесса.
+    """
+
+    # Сколько секунд остальные воркеры ждут ответа, который уже
+    # вычисляется, и как часто проверяют его появление.
+    lock_timeout = 5
+    poll_interval = 0.01
+
+    def __init__(self, name, maxsize=1024, timeout=60 * 60 * 24):
+        self.name = name
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.local = OrderedDict()
+        self.lock = threading.Lock()
+
+    @property
+    def version_key(self):
+        return f"reference:{self.name}:version"
+
+    def get_version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            version = self.bump()
+        return version
+
+    def bump(self):
+        """Меняет версию справочника, делая устаревшими все ответы."""
+
+        version = time.time_ns()
+        cache.set(self.version_key, version, None)
+        return version
+
+    def get_or_set(self, key, compute):
+        """Возвращает значение из памяти процесса для текущей версии,
+        вычисляя его при смене версии."""
+
+        version = self.get_version()
+        local_key = (version, key)
+        value = self.get_local(local_key)
+        if value is None:
+            value = compute()
+            self.store_local(local_key, value)
+        return value
+
+    def get_local(self, local_key):
+        with self.lock:
+            value = self.local.get(local_key)
+            if value is not None:
+                self.local.move_to_end(local_key)
+            return value
+
+    def store_local(self, local_key, value):
+        with self.lock:
+            self.local[local_key] = value
+            while len(self.local) > self.maxsize:
+                self.local.popitem(last=False)
+
+    def get_or_render(self, key, render, version=None):
+        """Возвращает пару (содержимое, ETag) для ключа запроса.
+
+        render вызывается только если ответа нет ни в памяти процесса,
+        ни в общем кэше. По умолчанию используется версия справочника.
+        """
+
+        if version is None:
+            version = self.get_version()
+        local_key = (version, key)
+        entry = self.get_local(local_key)
+        if entry is not None:
+            return entry
+
+        digest = hashlib.md5(key.encode()).hexdigest()
+        shared_key = f"reference:{self.name}:{version}:{digest}"
+        entry = cache.get(shared_key)
+        if entry is None:
+            entry = self.render_once(shared_key, render)
+
+        self.store_local(local_key, entry)
+        return entry
+
+    def make_entry(self, content):
+        return content, f'"{self.name}-{hashlib.md5(content).hexdigest()}"'
+
+    def render_once(self, shared_key, render):
+        """Вычисляет ответ в одном воркере, пока остальные ждут его
+        появления в общем кэше, чтобы промах не приводил к лавине
+        одинаковых запросов к базе данных."""
+
+        lock_key = f"{shared_key}:lock"
+        if cache.add(lock_key, 1, self.lock_timeout):
+            try:
+                entry = self.make_entry(render())
+                cache.set(shared_key, entry, self.timeout)
+            finally:
+                cache.delete(lock_key)
+            return entry
+
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            entry = cache.get(shared_key)
+            if entry is not None:
+                return entry
+        return self.make_entry(render())
+
+
+class RecipeResponseCache(ReferenceCache):
+    """Кэш ответов списка и страниц рецептов для анонимных пользователей.
+
+    Версия ответа складывается из версии списка рецептов или версии
+    конкретного рецепта и версий справочников, от которых зависит
+    ответ. Изменение рецепта меняет версию списка и версию рецепта,
+    поэтому страницы других рецептов остаются в кэше.
+    """
+
+    def __init__(
+        self,
+        name,
+        dependencies=(),
+        fragment_timeout=60 * 60 * 24,
+        **kwargs,
+    ):
+        super().__init__(name, **kwargs)
+        self.dependencies = dependencies
+        self.fragment_timeout = fragment_timeout
+
+    def recipe_version_key(self, pk):
+        return f"reference:{self.name}:{pk}:version"
+
+    def get_versions(self, keys):
+        versions = cache.get_many(keys)
+        missing = {
+            key: time.time_ns() for key in keys if key not in versions
+        }
+        if missing:
+            cache.set_many(missing, None)
+            versions.update(missing)
+        return versions
+
+    def get_response_version(self, pk=None):
+        keys = [
+            self.version_key if pk is None else self.recipe_version_key(pk),
+            *(dependency.version_key for dependency in self.dependencies),
+        ]
+        versions = self.get_versions(keys)
+        return ":".join(str(versions[key]) for key in keys)
+
+    def get_recipe_versions(self, pks):
+        """Версии рецептов вместе с версиями справочников одним
+        обращением к общему кэшу."""
+
+        dependency_keys = [
+            dependency.version_key for dependency in self.dependencies
+        ]
+        keys = {pk: self.recipe_version_key(pk) for pk in pks}
+        versions = self.get_versions([*keys.values(), *dependency_keys])
+        suffix = ":".join(str(versions[key]) for key in dependency_keys)
+        return {pk: f"{versions[key]}:{suffix}" for pk, key in keys.items()}
+
+    def get_fragments(self, keys, render):
+        """Возвращает фрагменты по словарю {pk: ключ фрагмента}.
+
+        Фрагменты ищутся в памяти процесса, затем в общем кэше;
+        render получает список недостающих pk и возвращает словарь
+        {pk: фрагмент}.
+        """
+
+        fragments = {}
+        shared = {}
+        for pk, key in keys.items():
+            fragment = self.get_local(("fragment", key))
+            if fragment is None:
+                shared[key] = pk
+            else:
+                fragments[pk] = fragment
+        if not shared:
+            return fragments
+
+        found = cache.get_many(shared)
+        missing = [pk for key, pk in shared.items() if key not in found]
+        rendered = render(missing) if missing else {}
+        cache.set_many(
+            {keys[pk]: fragment for pk, fragment in rendered.items()},
+            self.fragment_timeout,
+        )
+        for key, fragment in (
+            *found.items(),
+            *((keys[pk], fragment) for pk, fragment in rendered.items()),
+        ):
+            self.store_local(("fragment", key), fragment)
+            fragments[shared[key]] = fragment
+        return fragments
+
+    def invalidate(self, recipe_ids=()):
+        """Делает устаревшими список рецептов и страницы рецептов."""
+
+        version = time.time_ns()
+        versions = {self.recipe_version_key(pk): version for pk in recipe_ids}
+        versions[self.version_key] = version
+        cache.set_many(versions, None)
+
+
+tags_cache = ReferenceCache("tags")
+ingredients_cache = ReferenceCache("ingredients")
+
+
+recipes_cache = RecipeResponseCache(
+    "recipes",
+    dependencies=(tags_cache, ingredients_cache),
+    maxsize=4096,
+    timeout=settings.RECIPE_CACHE_TIMEOUT,
+)
+
+
+class CachedResponseMixin:
+    """Отдает JSON-ответы из кэша ответов с поддержкой ETag."""
+
+    response_cache = None
+
+    def get_cache_key(self, request):
+        """Ключ по нормализованной строке запроса: параметры и их
+        значения отсортированы, пустые значения отброшены."""
+
+        params = [
+            (key, sorted(value for value in values if value))
+            for key, values in sorted(request.query_params.lists())
+        ]
+        query = urlencode([item for item in params if item[1]], doseq=True)
+        return (
+            f"{request.get_host()}:{self.action}:"
+            f"{self.kwargs.get('pk', '')}:{query}"
+        )
+
+    def get_cache_version(self):
+        return None
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if request.accepted_renderer.format != "json":
+            return handler(request, *args, **kwargs)
+
+        def render():
+            response = handler(request, *args, **kwargs)
+            if isinstance(response, Response):
+                return JSONRenderer().render(response.data)
+            return response.content
+
+        content, etag = self.response_cache.get_or_render(
+            self.get_cache_key(request), render, self.get_cache_version()
+        )
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(content, content_type="application/json")
+        response["ETag"] = etag
+        return response
+
+
+class CachedReadOnlyMixin(CachedResponseMixin):
+    """Отдает list и retrieve справочников из ReferenceCache.
+
+    Справочники доступны всем, поэтому аутентификация отключена,
+    и на прогретом кэше запрос не обращается к базе данных.
+    """
+
+    authentication_classes = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
@@ -0,0 +1,75 @@
+import json
+
+from recipes.images import get_rendition_url
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(data):
+    """JSON в байтах: через orjson, если он установлен."""
+
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def serialize_tag(tag):
+    return {
+        "id": tag.id,
+        "name": tag.name,
+        "color": tag.color,
+        "slug": tag.slug,
+    }
+
+
+def serialize_user(user, is_subscribed):
+    return {
+        "email": user.email,
+        "id": user.id,
+        "username": user.username,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "is_subscribed": is_subscribed,
+    }
+
+
+def serialize_recipe_ingredient(item):
+    ingredient = item.ingredient
+    return {
+        "id": ingredient.id,
+        "name": ingredient.name,
+        "measurement_unit": ingredient.measurement_unit,
+        "amount": item.amount,
+    }
+
+
+def serialize_recipe(
+    recipe,
+    rendition="full",
+    is_favorited=False,
+    is_in_shopping_cart=False,
+    author_is_subscribed=False,
+):
+    """Словарь рецепта в формате RecipeListSerializer.
+
+    Рецепт должен быть загружен через RecipeQuerySet.with_related().
+    """
+
+    return {
+        "id": recipe.id,
+        "tags": [serialize_tag(tag) for tag in recipe.tags.all()],
+        "author": serialize_user(recipe.author, author_is_subscribed),
+        "ingredients": [
+            serialize_recipe_ingredient(item)
+            for item in recipe.recipe_ingredients.all()
+        ],
+        "is_favorited": is_favorited,
+        "is_in_shopping_cart": is_in_shopping_cart,
+        "name": recipe.name,
+        "image": get_rendition_url(recipe, rendition),
+        "text": recipe.text,
+        "cooking_time": recipe.cooking_time,
+    }
@@ -1,42 +1,140 @@
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db.models import (
+    BooleanField,
+    Case,
+    Exists,
+    F,
+    Func,
+    IntegerField,
+    OuterRef,
+    Q,
+    Value,
+    When,
+)
 from django_filters.rest_framework import FilterSet, filters
 
+from .cache import tags_cache
 from recipes.models import Ingredient, Recipe, Tag
 
 
+INGREDIENT_SEARCH_LIMIT = 30
+TRIGRAM_MIN_LENGTH = 3
+
+
+def name_contains(value):
+    """Условие "name ILIKE '%value%'" без UPPER(), которое использует
+    Django для icontains: его обслуживает индекс ingredient_name_trgm."""
+
+    escaped = (
+        value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    )
+    return Func(
+        F("name"),
+        Value(f"%{escaped}%"),
+        arg_joiner=" ILIKE ",
+        template="%(expressions)s",
+        output_field=BooleanField(),
+    )
+
+
 class IngredientFilter(FilterSet):
     """Фильтр для ингредиентов."""
 
     name = filters.CharFilter(lookup_expr="startswith")
+    search = filters.CharFilter(method="filter_search")
 
     class Meta:
         model = Ingredient
-        fields = ("name",)
+        fields = ("name", "search")
+
+    def filter_search(self, queryset, name, value):
+        """Поиск для автодополнения по индексу pg_trgm.
+
+        Сначала идут совпадения по началу названия, затем по вхождению,
+        затем похожие названия с опечатками. Список ингредиентов
+        ограничивает INGREDIENT_SEARCH_LIMIT записями IngredientViewSet.
+        """
+
+        value = value.strip().lower()
+        if not value:
+            return queryset
+        condition = Q(name_contains(value))
+        if len(value) >= TRIGRAM_MIN_LENGTH:
+            condition |= Q(name__trigram_similar=value)
+        return (
+            queryset.filter(condition)
+            .annotate(
+                rank=Case(
+                    When(name__istartswith=value, then=Value(0)),
+                    When(name__icontains=value, then=Value(1)),
+                    default=Value(2),
+                    output_field=IntegerField(),
+                ),
+                similarity=TrigramSimilarity("name", value),
+            )
+            .order_by("rank", "-similarity", "name")
+        )
+
+
+def get_tag_ids():
+    """Соответствие slug -> id тегов, закэшированное в памяти процесса."""
+
+    return tags_cache.get_or_set(
+        "slug_ids", lambda: dict(Tag.objects.values_list("slug", "id"))
+    )
+
+
+def get_tag_slug_choices():
+    return [(slug, slug) for slug in get_tag_ids()]
 
 
 class RecipeFilter(FilterSet):
     """Фильтр для рецептов."""
 
     author = filters.CharFilter(field_name="author__id")
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name="tags__slug",
-        to_field_name="slug",
-        queryset=Tag.objects.all(),
+    tags = filters.MultipleChoiceFilter(
+        method="filter_tags", choices=get_tag_slug_choices
     )
     is_favorited = filters.BooleanFilter(method="filter_is_favorited")
     is_in_shopping_cart = filters.BooleanFilter(
         method="filter_is_in_shopping_cart"
     )
+    search = filters.CharFilter(method="filter_search")
+    ordering = filters.ChoiceFilter(
+        method="filter_ordering", choices=(("popular", "popular"),)
+    )
 
     class Meta:
         model = Recipe
-        fields = ("author", "tags", "is_favorited", "is_in_shopping_cart")
+        fields = (
+            "author",
+            "tags",
+            "is_favorited",
+            "is_in_shopping_cart",
+            "search",
+            "ordering",
+        )
+
+    def filter_tags(self, queryset, name, value):
+        """Фильтрует рецепты по тегам полусоединением EXISTS,
+        без JOIN и дублей рецептов."""
+
+        tag_ids = get_tag_ids()
+        return queryset.filter(
+            Exists(
+                Recipe.tags.through.objects.filter(
+                    recipe=OuterRef("pk"),
+                    tag_id__in=[tag_ids[slug] for slug in value],
+                )
+            )
+        )
 
     def filter_is_favorited(self, queryset, name, value):
         """Фильтрует рецепты по наличию в избранном у текущего пользователя."""
 
         user = self.request.user
         if value and user.is_authenticated:
-            return queryset.filter(favorites__user=user)
+            return queryset.filter(is_favorited=True)
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
@@ -44,5 +142,22 @@ class RecipeFilter(FilterSet):
 
         user = self.request.user
         if value and user.is_authenticated:
-            return queryset.filter(in_shopping_cart__user=user)
+            return queryset.filter(is_in_shopping_cart=True)
+        return queryset
+
+    def filter_search(self, queryset, name, value):
+        """Полнотекстовый поиск по названию и описанию рецепта,
+        результаты отсортированы по релевантности."""
+
+        value = value.strip()
+        if not value:
+            return queryset
+        return queryset.search(value)
+
+    def filter_ordering(self, queryset, name, value):
+        """Сортирует рецепты по количеству добавлений в избранное
+        в порядке индекса recipe_popular_idx."""
+
+        if value == "popular":
+            return queryset.order_by("-favorites_count", "-pub_date", "-id")
         return queryset
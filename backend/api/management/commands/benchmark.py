@@ -0,0 +1,138 @@
+from contextlib import contextmanager
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from api.benchmarks import (
+    SCENARIOS,
+    compare,
+    make_report,
+    run,
+    save_baseline,
+)
+from recipes.models import Recipe
+from recipes.seeding import DEFAULT_SIZES, seed_dataset
+
+BENCHMARK_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Замер задержки эндпоинтов API на текущих данных или на "
+        "синтетическом наборе данных во временной базе"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "scenarios",
+            nargs="*",
+            help=f"Сценарии: {', '.join(SCENARIOS)}. По умолчанию все",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=20,
+            help="Количество повторов каждого запроса",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--dataset",
+            action="store_true",
+            help="Создать временную базу с синтетическими данными",
+        )
+        parser.add_argument(
+            "--keepdb",
+            action="store_true",
+            help="Не удалять временную базу и использовать ее повторно",
+        )
+        for name, default in DEFAULT_SIZES.items():
+            parser.add_argument(
+                f"--{name.replace('_', '-')}",
+                type=int,
+                default=default,
+                dest=f"size_{name}",
+                help=f"Размер набора данных: {name} (по умолчанию {default})",
+            )
+        parser.add_argument(
+            "--save-baseline",
+            metavar="PATH",
+            help="Сохранить результаты как базовую линию в JSON",
+        )
+        parser.add_argument(
+            "--compare",
+            metavar="PATH",
+            help="Сравнить с базовой линией и завершиться ошибкой "
+            "при регрессии",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.2,
+            help="Допустимый относительный рост p95 (по умолчанию 0.2)",
+        )
+
+    @contextmanager
+    def dataset(self, options, sizes):
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options["keepdb"]
+        )
+        try:
+            with override_settings(CACHES=BENCHMARK_CACHES):
+                if not Recipe.objects.exists():
+                    counts = seed_dataset(sizes, options["seed"])
+                    self.stdout.write(
+                        ", ".join(f"{k}={v}" for k, v in counts.items())
+                    )
+                yield
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options["keepdb"]
+            )
+
+    def handle(self, *args, **options):
+        names = options["scenarios"] or list(SCENARIOS)
+        unknown = set(names) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Неизвестные сценарии: {', '.join(unknown)}")
+
+        sizes = {name: options[f"size_{name}"] for name in DEFAULT_SIZES}
+        meta = {"repeat": options["repeat"], "seed": options["seed"]}
+        try:
+            if options["dataset"]:
+                meta["sizes"] = sizes
+                with self.dataset(options, sizes):
+                    results = run(names, options["repeat"], options["seed"])
+            else:
+                results = run(names, options["repeat"], options["seed"])
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        report = make_report(results)
+        self.print_report(report)
+        if options["save_baseline"]:
+            save_baseline(options["save_baseline"], report, meta)
+        if options["compare"]:
+            regressions = compare(
+                report, options["compare"], options["tolerance"]
+            )
+            for regression in regressions:
+                self.stderr.write(regression)
+            if regressions:
+                raise CommandError(f"Найдено регрессий: {len(regressions)}")
+            self.stdout.write(self.style.SUCCESS("Регрессий нет"))
+
+    def print_report(self, report):
+        self.stdout.write(
+            f"{'запрос':40} {'p50':>8} {'p95':>8} {'p99':>8}"
+            f" {'SQL':>4} {'rps':>8}"
+        )
+        for label, result in report.items():
+            self.stdout.write(
+                f"{label:40} {result['p50']:8.2f} {result['p95']:8.2f}"
+                f" {result['p99']:8.2f} {result['queries']:4}"
+                f" {result['rps']:8.1f}"
+            )
@@ -0,0 +1,179 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from api.benchmarks import (
+    SCENARIOS,
+    get_load_requests,
+    make_load_report,
+    run_load,
+)
+
+# Приложение, класс воркеров gunicorn и значение ASYNC_VIEWS по режимам.
+SERVER_MODES = {
+    "wsgi": ("foodgram.wsgi:application", "sync", "False"),
+    "asgi": (
+        "foodgram.asgi:application",
+        "uvicorn.workers.UvicornWorker",
+        "True",
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнение пропускной способности WSGI (gunicorn) и ASGI "
+        "(gunicorn + uvicorn) на текущих данных при большом числе "
+        "одновременных соединений"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "scenarios",
+            nargs="*",
+            help=f"Сценарии: {', '.join(SCENARIOS)}. По умолчанию все",
+        )
+        parser.add_argument(
+            "--modes",
+            nargs="+",
+            choices=list(SERVER_MODES),
+            default=list(SERVER_MODES),
+            help="Режимы сервера для сравнения",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=100,
+            help="Количество одновременных соединений",
+        )
+        parser.add_argument(
+            "--duration",
+            type=float,
+            default=20,
+            help="Длительность замера в секундах",
+        )
+        parser.add_argument(
+            "--warmup",
+            type=float,
+            default=3,
+            help="Длительность прогрева в секундах",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Количество воркеров gunicorn в обоих режимах",
+        )
+        parser.add_argument("--port", type=int, default=8100)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        names = options["scenarios"] or list(SCENARIOS)
+        unknown = set(names) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Неизвестные сценарии: {', '.join(unknown)}")
+        try:
+            requests = get_load_requests(names, options["seed"])
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        address = ("127.0.0.1", options["port"])
+        reports = {}
+        for mode in options["modes"]:
+            with self.server(mode, address, options["workers"]):
+                run_load(address, requests, 1, options["warmup"])
+                results, elapsed = run_load(
+                    address,
+                    requests,
+                    options["concurrency"],
+                    options["duration"],
+                )
+            reports[mode] = make_load_report(results, elapsed)
+            self.stdout.write(f"\n{mode}:")
+            self.print_report(reports[mode])
+
+        if len(reports) > 1:
+            self.stdout.write("")
+            for mode, report in reports.items():
+                self.stdout.write(
+                    f"{mode}: {report['total']['rps']:.1f} запросов/с, "
+                    f"p99 {report['total']['p99']:.1f} мс, "
+                    f"ошибок {report['total']['errors']}"
+                )
+
+    def server(self, mode, address, workers):
+        application, worker_class, async_views = SERVER_MODES[mode]
+        environment = dict(os.environ, ASYNC_VIEWS=async_views)
+        process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "gunicorn",
+                application,
+                "--bind",
+                "{}:{}".format(*address),
+                "--workers",
+                str(workers),
+                "--worker-class",
+                worker_class,
+            ],
+            cwd=settings.BASE_DIR,
+            env=environment,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        return RunningServer(process, address)
+
+    def print_report(self, report):
+        self.stdout.write(
+            f"{'запрос':40} {'p50':>8} {'p95':>8} {'p99':>8}"
+            f" {'rps':>8} {'ошибок':>7}"
+        )
+        for label, result in report.items():
+            self.stdout.write(
+                f"{label:40} {result['p50']:8.2f} {result['p95']:8.2f}"
+                f" {result['p99']:8.2f} {result['rps']:8.1f}"
+                f" {result['errors']:7}"
+            )
+
+
+class RunningServer:
+    """Запущенный сервер: при входе ждет, пока он начнет принимать
+    соединения, при выходе останавливает его."""
+
+    timeout = 30
+
+    def __init__(self, process, address):
+        self.process = process
+        self.address = address
+
+    def __enter__(self):
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise CommandError(
+                    f"Сервер завершился с кодом {self.process.returncode}"
+                )
+            try:
+                socket.create_connection(self.address, timeout=1).close()
+                return self
+            except OSError:
+                time.sleep(0.2)
+        self.stop()
+        raise CommandError(f"Сервер не запустился за {self.timeout} с")
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(self.timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
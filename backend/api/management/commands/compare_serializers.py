@@ -0,0 +1,76 @@
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from api.fast_serializers import dumps, serialize_recipe
+from api.serializers import RecipeListSerializer
+from recipes.models import Recipe
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Замер времени быстрой сериализации рецептов и "
+        "RecipeListSerializer. Совпадение ответов проверяют тесты api"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=500,
+            help="Количество рецептов для замера",
+        )
+        parser.add_argument(
+            "--user",
+            type=int,
+            help="id пользователя, для которого считаются флаги",
+        )
+
+    def handle(self, *args, **options):
+        user = self.get_user(options["user"])
+        recipes = list(
+            Recipe.objects.with_related().with_user_flags(user)[
+                : options["limit"]
+            ]
+        )
+        if not recipes:
+            raise CommandError("Нет рецептов для замера")
+
+        context = {"image_rendition": "card"}
+        start = time.perf_counter()
+        for recipe in recipes:
+            JSONRenderer().render(
+                RecipeListSerializer(recipe, context=context).data
+            )
+        drf_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for recipe in recipes:
+            dumps(
+                serialize_recipe(
+                    recipe,
+                    "card",
+                    recipe.is_favorited,
+                    recipe.is_in_shopping_cart,
+                    recipe.author_is_subscribed,
+                )
+            )
+        fast_time = time.perf_counter() - start
+
+        count = len(recipes)
+        self.stdout.write(
+            f"DRF: {drf_time * 1000 / count:.3f} мс/рецепт, "
+            f"быстрая: {fast_time * 1000 / count:.3f} мс/рецепт, "
+            f"ускорение {drf_time / fast_time:.1f}x"
+        )
+
+    def get_user(self, user_id):
+        if user_id is None:
+            return User.objects.order_by("id").first() or AnonymousUser()
+        try:
+            return User.objects.get(id=user_id)
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь {user_id} не найден")
@@ -1,4 +1,42 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def approximate_count(queryset):
+    """Оценка количества строк по плану запроса PostgreSQL без COUNT(*).
+
+    На других СУБД выполняется обычный count().
+    """
+
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return queryset.count()
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]["Plan Rows"]
+
+
+class ApproximateCountPaginator(Paginator):
+    """Пагинатор, который берет количество объектов из плана запроса."""
+
+    @cached_property
+    def count(self):
+        return approximate_count(self.object_list)
 
 
 class CustomPagination(PageNumberPagination):
@@ -7,3 +45,112 @@ class CustomPagination(PageNumberPagination):
 
     page_size = 6
     page_size_query_param = "limit"
+
+
+class RecipePagination(CustomPagination):
+    """Пагинация ленты рецептов.
+
+    По умолчанию работает как CustomPagination. С параметром cursor
+    включается keyset-пагинация по (pub_date, id): следующая страница
+    выбирается условием по индексу, без OFFSET и COUNT(*).
+    Параметр count=approx заменяет точный COUNT(*) оценкой планировщика.
+    """
+
+    cursor_query_param = "cursor"
+    count_query_param = "count"
+    cursor_ordering = ("-pub_date", "-id")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        approximate = request.query_params.get(self.count_query_param)
+        self.approximate = approximate == "approx"
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            if self.approximate:
+                self.django_paginator_class = ApproximateCountPaginator
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.cursor_ordering)
+        self.count = approximate_count(queryset) if self.approximate else None
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            pub_date, pk = position
+            queryset = queryset.filter(
+                Q(pub_date__lt=pub_date) | Q(id__lt=pk),
+                pub_date__lte=pub_date,
+            )
+        results = list(queryset[: self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.results = results[: self.page_size]
+        return self.results
+
+    def decode_cursor(self, request):
+        value = request.query_params.get(self.cursor_query_param)
+        if not value:
+            return None
+        try:
+            value = urlsafe_b64decode(value.encode()).decode()
+            pub_date, pk = value.split("|")
+            pub_date = parse_datetime(pub_date)
+            pk = int(pk)
+        except (TypeError, ValueError):
+            raise NotFound("Неверный курсор.")
+        if pub_date is None:
+            raise NotFound("Неверный курсор.")
+        return pub_date, pk
+
+    def encode_cursor(self, recipe):
+        return self.make_cursor(recipe.pub_date, recipe.id)
+
+    def make_cursor(self, pub_date, pk):
+        value = f"{pub_date.isoformat()}|{pk}"
+        return urlsafe_b64encode(value.encode()).decode()
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.results[-1]),
+        )
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response(
+            OrderedDict(
+                [
+                    ("count", self.count),
+                    ("next", self.get_next_link()),
+                    ("previous", None),
+                    ("results", data),
+                ]
+            )
+        )
+
+
+class TimelinePagination(RecipePagination):
+    """Keyset-пагинация ленты подписок.
+
+    Страница выбирается функцией load(position, size), которая
+    возвращает позиции рецептов (id, pub_date) после position.
+    """
+
+    def paginate_positions(self, load, request):
+        self.request = request
+        self.cursor_mode = True
+        self.count = None
+        self.page_size = self.get_page_size(request)
+        positions = load(self.decode_cursor(request), self.page_size + 1)
+        self.has_next = len(positions) > self.page_size
+        self.results = positions[: self.page_size]
+        return self.results
+
+    def encode_cursor(self, position):
+        pk, pub_date = position
+        return self.make_cursor(pub_date, pk)
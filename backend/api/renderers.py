@@ -0,0 +1,152 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.renderers import BaseRenderer
+
+
+class ShoppingCartRenderer(BaseRenderer):
+    """Базовый рендерер списка покупок.
+
+    Файл отдается частями через stream(), чтобы не собирать его
+    целиком в памяти. render() используется только для ответов
+    с ошибками.
+    """
+
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+    def get_content_type(self):
+        if self.charset:
+            return f"{self.media_type}; charset={self.charset}"
+        return self.media_type
+
+    def get_filename(self, user):
+        return f"{user}_shopping_cart.{self.format}"
+
+    def stream(self, ingredients, user):
+        """Возвращает генератор частей файла для StreamingHttpResponse."""
+
+        raise NotImplementedError
+
+
+class ShoppingCartTextRenderer(ShoppingCartRenderer):
+    """Список покупок в виде текстового файла."""
+
+    media_type = "text/plain"
+    format = "txt"
+
+    def stream(self, ingredients, user):
+        yield f"Список покупок {user.get_full_name()}\n\n"
+        for ingredient in ingredients:
+            yield (
+                f'{ingredient["ingredient__name"].capitalize()},'
+                f' {ingredient["amount"]}'
+                f' {ingredient["ingredient__measurement_unit"]}\n'
+            )
+        yield f"\n\nFoodgram {datetime.today():%d-%m-%Y}"
+
+
+class ShoppingCartCSVRenderer(ShoppingCartRenderer):
+    """Список покупок в формате CSV."""
+
+    media_type = "text/csv"
+    format = "csv"
+
+    def stream(self, ingredients, user):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(("name", "amount", "measurement_unit"))
+        for ingredient in ingredients:
+            writer.writerow(
+                (
+                    ingredient["ingredient__name"],
+                    ingredient["amount"],
+                    ingredient["ingredient__measurement_unit"],
+                )
+            )
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+
+class ShoppingCartJSONRenderer(ShoppingCartRenderer):
+    """Список покупок в формате JSON."""
+
+    media_type = "application/json"
+    format = "json"
+
+    def stream(self, ingredients, user):
+        yield "["
+        separator = ""
+        for ingredient in ingredients:
+            item = {
+                "name": ingredient["ingredient__name"],
+                "measurement_unit": ingredient["ingredient__measurement_unit"],
+                "amount": ingredient["amount"],
+            }
+            yield separator + json.dumps(item, ensure_ascii=False)
+            separator = ","
+        yield "]"
+
+
+class ShoppingCartPDFRenderer(ShoppingCartRenderer):
+    """Список покупок в формате PDF.
+
+    PDF нельзя отдавать построчно, поэтому документ собирается
+    в буфере после чтения агрегата и отдается одним куском.
+    """
+
+    media_type = "application/pdf"
+    format = "pdf"
+    charset = None
+    font_name = "ShoppingCartFont"
+    font_size = 12
+    line_height = 18
+    margin = 50
+
+    def register_font(self):
+        if self.font_name not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(
+                TTFont(self.font_name, settings.SHOPPING_CART_PDF_FONT)
+            )
+
+    def stream(self, ingredients, user):
+        self.register_font()
+        buffer = io.BytesIO()
+        pdf = canvas.Canvas(buffer, pagesize=A4)
+        _, height = A4
+        y = height - self.margin
+
+        def write_line(text):
+            nonlocal y
+            if y < self.margin:
+                pdf.showPage()
+                y = height - self.margin
+            pdf.setFont(self.font_name, self.font_size)
+            pdf.drawString(self.margin, y, text)
+            y -= self.line_height
+
+        write_line(f"Список покупок {user.get_full_name()}")
+        write_line("")
+        for ingredient in ingredients:
+            write_line(
+                f'{ingredient["ingredient__name"].capitalize()},'
+                f' {ingredient["amount"]}'
+                f' {ingredient["ingredient__measurement_unit"]}'
+            )
+        write_line("")
+        write_line(f"Foodgram {datetime.today():%d-%m-%Y}")
+        pdf.save()
+        yield buffer.getvalue()
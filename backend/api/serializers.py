@@ -3,19 +3,30 @@ from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
+from foodgram.metrics import TimedSerializerMixin
 from users.serializers import CustomUserSerializer
-from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
-
-
-class IngredientSerializer(serializers.ModelSerializer):
+from recipes.images import get_rendition_url, schedule_renditions
+from recipes.models import (
+    Ingredient,
+    MATCH_MAX_MISSING,
+    Recipe,
+    RecipeIngredient,
+    RecipeIngredientSet,
+    RecipeSimilarity,
+    ShoppingCartIngredient,
+    Tag,
+)
+
+
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для ингредиентов."""
 
     class Meta:
         model = Ingredient
-        fields = "__all__"
+        fields = ("id", "name", "measurement_unit")
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для тегов."""
 
     class Meta:
@@ -77,6 +88,17 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
                 "Ингридиенты не должны повторяться!"
             )
 
+        missing = set(ingredients) - set(
+            Ingredient.objects.filter(id__in=ingredients).values_list(
+                "id", flat=True
+            )
+        )
+        if missing:
+            raise serializers.ValidationError(
+                "Ингредиенты не найдены: "
+                f"{', '.join(map(str, sorted(missing)))}"
+            )
+
         return value
 
     def add_ingredients(self, ingredients, recipe):
@@ -91,6 +113,48 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
             ]
         )
 
+    def update_ingredients(self, ingredients, recipe):
+        """Применяет к рецепту только изменения состава ингредиентов
+        и переносит их разницу в списки покупок, где этот рецепт лежит."""
+
+        amounts = {item["id"]: item["amount"] for item in ingredients}
+        current = {
+            item.ingredient_id: item
+            for item in recipe.recipe_ingredients.all()
+        }
+        deltas = {}
+        deleted = []
+        changed = []
+        for ingredient_id, item in current.items():
+            amount = amounts.get(ingredient_id)
+            if amount is None:
+                deleted.append(item.id)
+                deltas[ingredient_id] = -item.amount
+            elif item.amount != amount:
+                deltas[ingredient_id] = amount - item.amount
+                item.amount = amount
+                changed.append(item)
+        added = [
+            {"id": ingredient_id, "amount": amount}
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in current
+        ]
+        deltas.update((item["id"], item["amount"]) for item in added)
+
+        if not deltas:
+            return
+
+        ShoppingCartIngredient.objects.apply_deltas(recipe.id, deltas)
+        if deleted:
+            RecipeIngredient.objects.filter(id__in=deleted).delete()
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ("amount",))
+        if added:
+            self.add_ingredients(added, recipe)
+        if deleted or added:
+            RecipeIngredientSet.objects.refresh([recipe.id])
+            RecipeSimilarity.objects.mark_stale([recipe.id])
+
     @transaction.atomic
     def create(self, validated_data):
         author = self.context.get("request").user
@@ -101,17 +165,25 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         recipe.tags.set(tags)
 
         self.add_ingredients(ingredients, recipe)
+        RecipeIngredientSet.objects.refresh([recipe.id])
+        schedule_renditions(recipe.id)
         return recipe
 
     @transaction.atomic
     def update(self, instance, validated_data):
         if "ingredients" in validated_data:
-            ingredients = validated_data.pop("ingredients")
-            instance.ingredients.clear()
-            self.add_ingredients(ingredients, instance)
+            self.update_ingredients(
+                validated_data.pop("ingredients"), instance
+            )
         if "tags" in validated_data:
             instance.tags.set(validated_data.pop("tags"))
-        return super().update(instance, validated_data)
+            RecipeSimilarity.objects.mark_stale([instance.id])
+        recipe = super().update(instance, validated_data)
+        if "image" in validated_data:
+            Recipe.objects.filter(id=recipe.id).update(image_renditions={})
+            recipe.image_renditions = {}
+            schedule_renditions(recipe.id)
+        return recipe
 
     def to_representation(self, instance):
         return RecipeListSerializer(
@@ -119,11 +191,24 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         ).data
 
 
-class RecipeListSerializer(serializers.ModelSerializer):
+class RecipeMatchQuerySerializer(serializers.Serializer):
+    """Параметры подбора рецептов по имеющимся ингредиентам."""
+
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=200,
+    )
+    max_missing = serializers.IntegerField(
+        min_value=0, max_value=MATCH_MAX_MISSING, default=2
+    )
+
+
+class RecipeListSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для получения рецептов."""
 
     author = CustomUserSerializer(read_only=True)
-    image = serializers.ReadOnlyField(source="image.url")
+    image = serializers.SerializerMethodField()
     tags = TagSerializer(many=True)
     ingredients = RecipeIngredientsSerializer(
         many=True, required=True, source="recipe_ingredients"
@@ -146,23 +231,42 @@ class RecipeListSerializer(serializers.ModelSerializer):
             "cooking_time",
         )
 
+    def to_representation(self, instance):
+        if hasattr(instance, "author_is_subscribed"):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        return super().to_representation(instance)
+
+    def get_image(self, obj):
+        return get_rendition_url(
+            obj, self.context.get("image_rendition", "full")
+        )
+
     def get_is_favorited(self, obj):
+        if hasattr(obj, "is_favorited"):
+            return obj.is_favorited
         user = self.context.get("request").user
         if user.is_anonymous:
             return False
         return user.favorites.filter(recipe=obj).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, "is_in_shopping_cart"):
+            return obj.is_in_shopping_cart
         user = self.context.get("request").user
         if user.is_anonymous:
             return False
         return user.shopping_cart.filter(recipe=obj).exists()
 
 
-class RecipeMinified(serializers.ModelSerializer):
+class RecipeMinified(TimedSerializerMixin, serializers.ModelSerializer):
     """Упрощенный сериализатор для списка рецептов."""
 
+    image = serializers.SerializerMethodField()
+
     class Meta:
         model = Recipe
         fields = ("id", "name", "image", "cooking_time")
         read_only_fields = ("id", "name", "image", "cooking_time")
+
+    def get_image(self, obj):
+        return get_rendition_url(obj, "thumbnail")
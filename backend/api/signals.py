@@ -0,0 +1,53 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import ingredients_cache, recipes_cache, tags_cache
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from users.models import User
+
+
+def invalidate_recipes(recipe_ids):
+    recipe_ids = list(recipe_ids)
+    transaction.on_commit(lambda: recipes_cache.invalidate(recipe_ids))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags(**kwargs):
+    transaction.on_commit(tags_cache.bump)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients(**kwargs):
+    transaction.on_commit(ingredients_cache.bump)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe(instance, **kwargs):
+    invalidate_recipes([instance.id])
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def invalidate_recipe_ingredient(instance, **kwargs):
+    invalidate_recipes([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags(instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if not reverse:
+        invalidate_recipes([instance.id])
+    elif action == "pre_clear":
+        invalidate_recipes(instance.recipes.values_list("id", flat=True))
+    else:
+        invalidate_recipes(pk_set)
+
+
+@receiver(post_save, sender=User)
+def invalidate_author(instance, created, update_fields, **kwargs):
+    if created or (
+        update_fields and set(update_fields) <= {"last_login", "password"}
+    ):
+        return
+    invalidate_recipes(instance.recipes.values_list("id", flat=True))
@@ -0,0 +1,571 @@
+import io
+import json
+import random
+import threading
+import time
+from collections import OrderedDict
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .cache import ReferenceCache
+from .fast_serializers import dumps, serialize_recipe
+from .filters import INGREDIENT_SEARCH_LIMIT
+from .serializers import RecipeCreateUpdateSerializer, RecipeListSerializer
+from .timeline import get_timeline, invalidate_timeline
+from recipes.management.commands.import_data import iter_json
+from recipes.models import (
+    MATCH_MAX_MISSING,
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    RecipeIngredientSet,
+    ShoppingCart,
+    ShoppingCartIngredient,
+    Tag,
+)
+from users.models import Subscription, User
+
+TEST_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+}
+
+
+class RecipeDataMixin:
+    """Авторы, теги, ингредиенты и 60 рецептов, часть из которых
+    пользователь добавил в избранное и список покупок, а на часть
+    авторов подписан."""
+
+    recipe_count = 60
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="reader",
+            email="reader@example.com",
+            password="password",
+            first_name="Читатель",
+            last_name="Рецептов",
+        )
+        authors = [
+            User.objects.create_user(
+                username=f"author{number}",
+                email=f"author{number}@example.com",
+                password="password",
+                first_name="Автор",
+                last_name=f"Номер {number}",
+            )
+            for number in range(3)
+        ]
+        tags = Tag.objects.bulk_create(
+            Tag(name=name, color=color, slug=slug)
+            for name, color, slug in (
+                ("Завтрак", "#E26C2D", "breakfast"),
+                ("Обед", "#49B64E", "lunch"),
+                ("Ужин", "#8775D2", "dinner"),
+            )
+        )
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit=unit)
+            for name, unit in (
+                ("мука", "г"),
+                ("молоко", "мл"),
+                ("яйца", "шт."),
+                ("соль", "по вкусу"),
+            )
+        )
+        recipes = Recipe.objects.bulk_create(
+            Recipe(
+                author=authors[number % len(authors)],
+                name=f"Рецепт «{number}»",
+                text=f'Описание рецепта {number}: "шаг 1", шаг 2.\nГотово',
+                image=f"recipes/images/recipe{number}.jpg",
+                cooking_time=number + 1,
+            )
+            for number in range(cls.recipe_count)
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient=ingredients[(number + shift) % len(ingredients)],
+                amount=(number + 1) * (shift + 1),
+            )
+            for number, recipe in enumerate(recipes)
+            for shift in range(number % 3 + 1)
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(
+                recipe=recipe, tag=tags[(number + shift) % len(tags)]
+            )
+            for number, recipe in enumerate(recipes)
+            for shift in range(number % 2 + 1)
+        )
+        Favorite.objects.bulk_create(
+            Favorite(user=cls.user, recipe=recipe) for recipe in recipes[::4]
+        )
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=cls.user, recipe=recipe)
+            for recipe in recipes[::5]
+        )
+        Subscription.objects.create(user=cls.user, author=authors[0])
+        cls.recipes = recipes
+
+    def setUp(self):
+        cache.clear()
+
+    def get_clients(self):
+        authenticated = APIClient()
+        authenticated.force_authenticate(self.user)
+        return {"anonymous": APIClient(), "authenticated": authenticated}
+
+    def assertCartTotalsLive(self):
+        """Проверяет, что агрегат списков покупок совпадает с суммами
+        по корзинам, и возвращает эти суммы."""
+
+        totals = {
+            (row["user"], row["ingredient"]): row["amount"]
+            for row in ShoppingCartIngredient.objects.live_totals()
+        }
+        stored = {
+            (row.user_id, row.ingredient_id): row.amount
+            for row in ShoppingCartIngredient.objects.all()
+        }
+        self.assertEqual(stored, totals)
+        return totals
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RecipeQueryCountTests(RecipeDataMixin, TestCase):
+    """Число SQL-запросов списка и страницы рецепта не зависит
+    от размера страницы и пользователя."""
+
+    list_queries = 5
+    detail_queries = 4
+
+    def test_list_query_count(self):
+        for name, client in self.get_clients().items():
+            for limit in (6, 50):
+                with self.subTest(user=name, limit=limit):
+                    cache.clear()
+                    with self.assertNumQueries(self.list_queries):
+                        response = client.get(
+                            "/api/recipes/", {"limit": limit}
+                        )
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(len(response.json()["results"]), limit)
+
+    def test_detail_query_count(self):
+        for name, client in self.get_clients().items():
+            for recipe in self.recipes[:3]:
+                with self.subTest(user=name, recipe=recipe.id):
+                    cache.clear()
+                    with self.assertNumQueries(self.detail_queries):
+                        response = client.get(f"/api/recipes/{recipe.id}/")
+                    self.assertEqual(response.status_code, 200)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class FastSerializerEquivalenceTests(RecipeDataMixin, TestCase):
+    """Ответы из fast_serializers побайтно совпадают с
+    RecipeListSerializer."""
+
+    def get_users(self):
+        return {"anonymous": AnonymousUser(), "authenticated": self.user}
+
+    def serialize_reference(self, user, recipe_ids, rendition):
+        """Данные рецептов в порядке recipe_ids от RecipeListSerializer."""
+
+        recipes = (
+            Recipe.objects.with_related()
+            .with_user_flags(user)
+            .in_bulk(recipe_ids)
+        )
+        return RecipeListSerializer(
+            [recipes[pk] for pk in recipe_ids],
+            many=True,
+            context={"image_rendition": rendition},
+        ).data
+
+    def test_list_page(self):
+        clients = self.get_clients()
+        for name, user in self.get_users().items():
+            with self.subTest(user=name):
+                response = clients[name].get(
+                    "/api/recipes/", {"limit": 10, "page": 2}
+                )
+                data = response.json()
+                results = self.serialize_reference(
+                    user, [recipe["id"] for recipe in data["results"]], "card"
+                )
+                reference = OrderedDict(
+                    count=data["count"],
+                    next=data["next"],
+                    previous=data["previous"],
+                    results=results,
+                )
+                self.assertEqual(
+                    response.content, JSONRenderer().render(reference)
+                )
+
+    def test_detail_page(self):
+        clients = self.get_clients()
+        for name, user in self.get_users().items():
+            for recipe in self.recipes[:4]:
+                with self.subTest(user=name, recipe=recipe.id):
+                    response = clients[name].get(
+                        f"/api/recipes/{recipe.id}/"
+                    )
+                    (reference,) = self.serialize_reference(
+                        user, [recipe.id], "full"
+                    )
+                    self.assertEqual(
+                        response.content, JSONRenderer().render(reference)
+                    )
+
+    def test_nested_ingredients(self):
+        recipe = Recipe.objects.create(
+            author=self.user,
+            name="Блины",
+            text="Смешать <все> & жарить \\ «на сковороде»",
+            image="recipes/images/pancakes.jpg",
+            cooking_time=30,
+        )
+        recipe.tags.set(Tag.objects.all())
+        Favorite.objects.create(user=self.user, recipe=recipe)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, ingredient=ingredient, amount=amount
+            )
+            for amount, ingredient in enumerate(Ingredient.objects.all(), 1)
+        )
+        for name, user in self.get_users().items():
+            with self.subTest(user=name):
+                loaded = (
+                    Recipe.objects.with_related()
+                    .with_user_flags(user)
+                    .get(id=recipe.id)
+                )
+                self.assertEqual(len(loaded.recipe_ingredients.all()), 4)
+                fast = dumps(
+                    serialize_recipe(
+                        loaded,
+                        "full",
+                        loaded.is_favorited,
+                        loaded.is_in_shopping_cart,
+                        loaded.author_is_subscribed,
+                    )
+                )
+                (reference,) = self.serialize_reference(
+                    user, [recipe.id], "full"
+                )
+                self.assertEqual(fast, JSONRenderer().render(reference))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ShoppingCartTests(RecipeDataMixin, TestCase):
+    """Добавление и удаление рецептов из корзины обновляет агрегат
+    списка покупок."""
+
+    def test_remove_and_add(self):
+        Recipe.objects.reconcile_counters()
+        ShoppingCartIngredient.objects.rebuild()
+        client = self.get_clients()["authenticated"]
+        for recipe in self.recipes[:10:5]:
+            with self.subTest(recipe=recipe.id):
+                url = f"/api/recipes/{recipe.id}/shopping_cart/"
+                response = client.delete(url)
+                self.assertEqual(response.status_code, 204)
+                self.assertCartTotalsLive()
+                response = client.post(url)
+                self.assertEqual(response.status_code, 201)
+                self.assertCartTotalsLive()
+
+
+@override_settings(CACHES=TEST_CACHES)
+class IngredientSearchTests(TestCase):
+    """Фильтры name и search списка ингредиентов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f"мука сорт {number}", measurement_unit="г")
+            for number in range(40)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_name_is_case_sensitive_prefix(self):
+        self.assertEqual(
+            len(self.client.get("/api/ingredients/?name=мука").json()), 40
+        )
+        self.assertEqual(
+            self.client.get("/api/ingredients/?name=Мука").json(), []
+        )
+        self.assertEqual(
+            self.client.get("/api/ingredients/?name=сорт").json(), []
+        )
+
+    def test_search_is_limited(self):
+        response = self.client.get("/api/ingredients/?search=МУКА")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), INGREDIENT_SEARCH_LIMIT)
+
+    def test_search_escapes_like_wildcards(self):
+        self.assertEqual(
+            self.client.get("/api/ingredients/?search=%25").json(), []
+        )
+
+    def test_detail_with_filters(self):
+        ingredient = self.ingredients[0]
+        for query in ("name=мука", "search=мука"):
+            with self.subTest(query=query):
+                response = self.client.get(
+                    f"/api/ingredients/{ingredient.id}/?{query}"
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()["id"], ingredient.id)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RecipeUpdateTests(RecipeDataMixin, TestCase):
+    """Редактирование рецепта не затирает поля, которые меняются
+    отдельными запросами после загрузки рецепта."""
+
+    def test_update_keeps_separately_updated_fields(self):
+        recipe = Recipe.objects.get(id=self.recipes[0].id)
+        renditions = {"card": "recipes/renditions/card.webp"}
+        Recipe.objects.filter(id=recipe.id).update(
+            favorites_count=F("favorites_count") + 5,
+            in_carts_count=F("in_carts_count") + 3,
+            image_renditions=renditions,
+        )
+        serializer = RecipeCreateUpdateSerializer(
+            recipe, data={"name": "Новое название"}, partial=True
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        saved = Recipe.objects.get(id=recipe.id)
+        self.assertEqual(saved.name, "Новое название")
+        self.assertEqual(saved.favorites_count, recipe.favorites_count + 5)
+        self.assertEqual(saved.in_carts_count, recipe.in_carts_count + 3)
+        self.assertEqual(saved.image_renditions, renditions)
+
+    def test_update_ingredients_applies_deltas_to_carts(self):
+        recipe = self.recipes[5]
+        other = User.objects.create_user(
+            username="other", email="other@example.com", password="password"
+        )
+        ShoppingCart.objects.create(user=other, recipe=recipe)
+        ShoppingCart.objects.create(user=other, recipe=self.recipes[7])
+        ShoppingCartIngredient.objects.rebuild()
+        ingredients = {
+            item.ingredient_id: item.amount
+            for item in recipe.recipe_ingredients.all()
+        }
+        kept, changed, removed = sorted(ingredients)
+        added = (
+            Ingredient.objects.exclude(id__in=ingredients)
+            .values_list("id", flat=True)
+            .first()
+        )
+        serializer = RecipeCreateUpdateSerializer(
+            recipe,
+            data={
+                "ingredients": [
+                    {"id": kept, "amount": ingredients[kept]},
+                    {"id": changed, "amount": ingredients[changed] + 7},
+                    {"id": added, "amount": 4},
+                ]
+            },
+            partial=True,
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        self.assertIn((other.id, removed), self.assertCartTotalsLive())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class TimelineCacheTests(RecipeDataMixin, TestCase):
+    """Кэш начала ленты подписок и изменение подписок."""
+
+    def get_authors(self, user):
+        positions = get_timeline(user.id, None, 60)
+        return set(
+            Recipe.objects.filter(
+                id__in=[pk for pk, _ in positions]
+            ).values_list("author_id", flat=True)
+        )
+
+    def test_subscription_during_computation(self):
+        author = self.recipes[1].author
+        followed_timeline = Recipe.objects.followed_timeline
+
+        def subscribe_concurrently(*args):
+            positions = followed_timeline(*args)
+            Subscription.objects.create(user=self.user, author=author)
+            invalidate_timeline(self.user.id)
+            return positions
+
+        with mock.patch.object(
+            Recipe.objects,
+            "followed_timeline",
+            side_effect=subscribe_concurrently,
+        ):
+            self.assertNotIn(author.id, self.get_authors(self.user))
+        self.assertIn(author.id, self.get_authors(self.user))
+
+    def test_head_is_cached(self):
+        get_timeline(self.user.id, None, 10)
+        with self.assertNumQueries(0):
+            get_timeline(self.user.id, None, 10)
+
+
+class RecipeMatchTests(TestCase):
+    """Подбор рецептов по индексу совпадает с полным перебором."""
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(0)
+        author = User.objects.create_user(
+            username="cook", email="cook@example.com", password="password"
+        )
+        cls.ingredients = [
+            ingredient.id
+            for ingredient in Ingredient.objects.bulk_create(
+                Ingredient(name=f"ингредиент {number}", measurement_unit="г")
+                for number in range(12)
+            )
+        ]
+        recipes = Recipe.objects.bulk_create(
+            Recipe(
+                author=author,
+                name=f"Рецепт {number}",
+                text="Описание",
+                image=f"recipes/images/recipe{number}.jpg",
+                cooking_time=10,
+            )
+            for number in range(80)
+        )
+        cls.recipe_ingredients = {
+            recipe.id: set(rng.sample(cls.ingredients, rng.randint(1, 6)))
+            for recipe in recipes
+        }
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe_id=recipe_id, ingredient_id=ingredient_id, amount=1
+            )
+            for recipe_id, ingredient_ids in cls.recipe_ingredients.items()
+            for ingredient_id in ingredient_ids
+        )
+        RecipeIngredientSet.objects.rebuild()
+        cls.queries = [
+            rng.sample(cls.ingredients, size)
+            for size in (1, 1, 2, 3, 4, 6, 9)
+        ]
+
+    def brute_force(self, available, max_missing):
+        rows = []
+        for recipe_id, ingredient_ids in self.recipe_ingredients.items():
+            matched = len(ingredient_ids & available)
+            missing = sorted(ingredient_ids - available)
+            if matched and len(missing) <= max_missing:
+                rows.append((recipe_id, matched, missing))
+        return sorted(
+            rows,
+            key=lambda row: (
+                len(row[2]),
+                -row[1] / (row[1] + len(row[2])),
+                -row[0],
+            ),
+        )
+
+    def test_match_equals_brute_force(self):
+        for available in self.queries:
+            for max_missing in range(MATCH_MAX_MISSING + 1):
+                with self.subTest(
+                    available=available, max_missing=max_missing
+                ):
+                    self.assertEqual(
+                        RecipeIngredientSet.objects.match(
+                            available, max_missing, 1000
+                        ),
+                        self.brute_force(set(available), max_missing),
+                    )
+
+
+class ImportJsonTests(SimpleTestCase):
+    """Потоковое чтение JSON в команде import_data."""
+
+    items = [
+        {"name": f"ингредиент {number}", "measurement_unit": "г"}
+        for number in range(50)
+    ] + [12345, "строка, ]"]
+
+    def read(self, text, chunk_size):
+        return list(iter_json(io.StringIO(text), chunk_size))
+
+    def test_array_and_json_lines(self):
+        texts = {
+            "array": json.dumps(self.items, indent=1, ensure_ascii=False),
+            "lines": "\n".join(json.dumps(item) for item in self.items),
+        }
+        for name, text in texts.items():
+            for chunk_size in (1, 7, 64 * 1024):
+                with self.subTest(format=name, chunk_size=chunk_size):
+                    self.assertEqual(self.read(text, chunk_size), self.items)
+        self.assertEqual(self.read("[ ]", 1), [])
+
+    def test_malformed_separators(self):
+        for text in (
+            '[,,{"a": 1}]',
+            '[{"a": 1},,{"b": 2}]',
+            '[{"a": 1} {"b": 2}]',
+            '[{"a": 1},]',
+            '[{"a": 1}] {"b": 2}',
+            '{"a": 1},{"b": 2}',
+            '[{"a": 1}',
+        ):
+            for chunk_size in (1, 64 * 1024):
+                with self.subTest(text=text, chunk_size=chunk_size):
+                    with self.assertRaises(ValueError):
+                        self.read(text, chunk_size)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ReferenceCacheTests(SimpleTestCase):
+    """Однократное вычисление ответа при промахе кэша."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_render_once_per_process(self):
+        reference = ReferenceCache("single-flight")
+        calls = []
+        barrier = threading.Barrier(8)
+        entries = []
+
+        def render():
+            calls.append(1)
+            time.sleep(0.1)
+            return b"[]"
+
+        def request():
+            barrier.wait()
+            entries.append(reference.get_or_render("key", render, 1))
+
+        threads = [threading.Thread(target=request) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(entries, [reference.make_entry(b"[]")] * 8)
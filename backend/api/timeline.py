@@ -0,0 +1,62 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from recipes.models import Recipe
+
+# Сколько позиций начала ленты подписок кэшируется для пользователя.
+TIMELINE_HEAD_SIZE = 60
+
+
+def generation_key(user_id):
+    return f"timeline:{user_id}:generation"
+
+
+def timeline_key(user_id, generation):
+    return f"timeline:{user_id}:{generation}"
+
+
+def get_generation(user_id):
+    """Текущее поколение ленты пользователя. Меняется при каждом
+    изменении его подписок."""
+
+    key = generation_key(user_id)
+    generation = cache.get(key)
+    if generation is None:
+        generation = time.time_ns()
+        if not cache.add(key, generation, None):
+            generation = cache.get(key, generation)
+    return generation
+
+
+def get_timeline(user_id, position, limit):
+    """Позиции (id, pub_date) ленты подписок пользователя, не больше
+    limit, после позиции position.
+
+    Начало ленты кэшируется на TIMELINE_CACHE_TIMEOUT секунд: новые
+    рецепты авторов появляются в ленте с этой задержкой. Кэш хранится
+    по поколению ленты, прочитанному до запроса к базе данных. Если
+    подписки изменились, пока начало ленты вычислялось, оно сохраняется
+    под старым поколением и следующие запросы его не увидят.
+    """
+
+    if position is not None or limit > TIMELINE_HEAD_SIZE + 1:
+        return Recipe.objects.followed_timeline(user_id, position, limit)
+    generation = get_generation(user_id)
+    key = timeline_key(user_id, generation)
+    head = cache.get(key)
+    if head is None:
+        head = Recipe.objects.followed_timeline(
+            user_id, None, TIMELINE_HEAD_SIZE + 1
+        )
+        if cache.get(generation_key(user_id)) == generation:
+            cache.set(key, head, settings.TIMELINE_CACHE_TIMEOUT)
+    return head[:limit]
+
+
+def invalidate_timeline(user_id):
+    """Начинает новое поколение ленты. Вызывается после фиксации
+    изменения подписок, чтобы новое поколение вычислялось уже по ним."""
+
+    cache.set(generation_key(user_id), time.time_ns(), None)
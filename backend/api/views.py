@@ -1,58 +1,203 @@
-from datetime import datetime
+from functools import partial
+from itertools import chain
 
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import F
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
-from .filters import IngredientFilter, RecipeFilter
-from .pagination import CustomPagination
+from .bulk import (
+    BulkIdsSerializer,
+    add_relations,
+    bulk_response_data,
+    lock_user,
+    remove_relations,
+)
+from .cache import (
+    CachedReadOnlyMixin,
+    CachedResponseMixin,
+    ingredients_cache,
+    recipes_cache,
+    tags_cache,
+)
+from .filters import INGREDIENT_SEARCH_LIMIT, IngredientFilter, RecipeFilter
+from .fragments import render_recipes
+from .pagination import (
+    CustomPagination,
+    RecipePagination,
+    TimelinePagination,
+)
 from .permissions import IsOwnerOrAdmin
+from .renderers import (
+    ShoppingCartCSVRenderer,
+    ShoppingCartJSONRenderer,
+    ShoppingCartPDFRenderer,
+    ShoppingCartTextRenderer,
+)
 from .serializers import (
     IngredientSerializer,
     RecipeCreateUpdateSerializer,
     RecipeListSerializer,
+    RecipeMatchQuerySerializer,
     RecipeMinified,
     TagSerializer,
 )
+from .timeline import get_timeline
+from foodgram.async_views import AsyncViewSetMixin
 from recipes.models import (
     Favorite,
     Ingredient,
     Recipe,
-    RecipeIngredient,
+    RecipeIngredientSet,
+    RecipeSimilarity,
     ShoppingCart,
+    ShoppingCartIngredient,
     Tag,
 )
 
+SHOPPING_CART_CHUNK_SIZE = 500
+
+# Сколько лучших совпадений подбора по ингредиентам доступно
+# для постраничного просмотра.
+MATCH_RESULTS_LIMIT = 500
+
+# Счетчик рецепта, который меняется при добавлении в модель.
+RECIPE_COUNTERS = {
+    Favorite: "favorites_count",
+    ShoppingCart: "in_carts_count",
+}
+
+
+def paginated_content(response, items):
+    """Ответ пагинатора с готовым JSON рецептов вместо results."""
+
+    envelope = JSONRenderer().render(response.data)
+    content = b"".join((envelope[:-2], b",".join(items), envelope[-2:]))
+    return HttpResponse(content, content_type="application/json")
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+
+class IngredientViewSet(
+    AsyncViewSetMixin, CachedReadOnlyMixin, viewsets.ReadOnlyModelViewSet
+):
     """ViewSet для чтения списка ингредиентов."""
 
+    response_cache = ingredients_cache
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
 
+    def filter_queryset(self, queryset):
+        """В режиме автодополнения (search) список ограничен
+        INGREDIENT_SEARCH_LIMIT лучшими совпадениями."""
+
+        queryset = super().filter_queryset(queryset)
+        search = self.request.query_params.get("search", "").strip()
+        if self.action == "list" and search:
+            return queryset[:INGREDIENT_SEARCH_LIMIT]
+        return queryset
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+
+class TagViewSet(
+    AsyncViewSetMixin, CachedReadOnlyMixin, viewsets.ReadOnlyModelViewSet
+):
     """ViewSet для чтения списка тегов."""
 
+    response_cache = tags_cache
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
-    """ViewSet для создания, чтения, обновления и удаления рецептов."""
+class RecipeViewSet(
+    AsyncViewSetMixin, CachedResponseMixin, viewsets.ModelViewSet
+):
+    """ViewSet для создания, чтения, обновления и удаления рецептов.
+
+    JSON-ответы list и retrieve собираются из кэшированных фрагментов
+    рецептов. С параметром search рецепты списка дополняются полем
+    search_highlight. Анонимным пользователям флаги всегда ложны,
+    поэтому их ответы целиком кэшируются по нормализованной строке
+    запроса.
+    """
 
     queryset = Recipe.objects.all()
-    pagination_class = CustomPagination
+    response_cache = recipes_cache
+    pagination_class = RecipePagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        return Recipe.objects.with_related().with_user_flags(
+            self.request.user
+        )
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["image_rendition"] = (
+            "card" if self.action == "list" else "full"
+        )
+        return context
+
+    def get_cache_version(self):
+        return self.response_cache.get_response_version(
+            self.kwargs.get("pk")
+        )
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != "json":
+            return super().list(request, *args, **kwargs)
+        if request.user.is_anonymous:
+            return self.cached_response(self.render_list, request)
+        return self.render_list(request)
+
+    def retrieve(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != "json":
+            return super().retrieve(request, *args, **kwargs)
+        if request.user.is_anonymous:
+            return self.cached_response(self.render_detail, request)
+        return self.render_detail(request)
+
+    def render_list(self, request):
+        """Страница рецептов из фрагментов и флагов пользователя,
+        полученных в запросе страницы."""
+
+        queryset = self.filter_queryset(
+            Recipe.objects.with_user_flags(request.user)
+        )
+        page = self.paginate_queryset(queryset)
+        items = render_recipes(page, "card", self.get_search_extra(page))
+        return paginated_content(self.get_paginated_response([]), items)
+
+    def get_search_extra(self, page):
+        """Подсветка совпадений для рецептов страницы в режиме поиска:
+        {id: {"search_highlight": {"name": ..., "text": ...}}}."""
+
+        search = self.request.query_params.get("search", "").strip()
+        if not search or not page:
+            return None
+        highlights = Recipe.objects.filter(
+            id__in=[recipe.id for recipe in page]
+        ).search_highlights(search)
+        return {
+            pk: {"search_highlight": highlight}
+            for pk, highlight in highlights.items()
+        }
+
+    def render_detail(self, request):
+        queryset = self.filter_queryset(
+            Recipe.objects.with_user_flags(request.user)
+        )
+        recipe = get_object_or_404(queryset, pk=self.kwargs["pk"])
+        self.check_object_permissions(request, recipe)
+        (content,) = render_recipes([recipe], "full")
+        return HttpResponse(content, content_type="application/json")
+
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeListSerializer
@@ -65,9 +210,16 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return (IsAuthenticated(),)
         return super().get_permissions()
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        ShoppingCartIngredient.objects.apply_recipe(instance.id, sign=-1)
+        instance.delete()
+
+    @transaction.atomic
     def add_to(self, model, user, pk):
         """Добавляет рецепт в указанную модель."""
 
+        lock_user(user)
         if model.objects.filter(user=user, recipe__id=pk).exists():
             return Response(
                 {"Ошибка": "Рецепт уже был добавлен"},
@@ -75,15 +227,35 @@ class RecipeViewSet(viewsets.ModelViewSet):
             )
         recipe = get_object_or_404(Recipe, id=pk)
         model.objects.create(user=user, recipe=recipe)
+        counter = RECIPE_COUNTERS[model]
+        Recipe.objects.filter(id=recipe.id).update(**{counter: F(counter) + 1})
+        if model is ShoppingCart:
+            ShoppingCartIngredient.objects.apply_recipe(
+                recipe.id, user_id=user.id
+            )
+        if model is Favorite:
+            RecipeSimilarity.objects.mark_stale([recipe.id])
         serializer = RecipeMinified(recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @transaction.atomic
     def delete_from(self, model, user, pk):
         """Удаляет рецепт из указанной модели."""
 
+        lock_user(user)
         obj = model.objects.filter(user=user, recipe__id=pk)
         if obj.exists():
-            obj.delete()
+            if model is ShoppingCart:
+                ShoppingCartIngredient.objects.apply_recipe(
+                    pk, sign=-1, user_id=user.id
+                )
+            deleted, _ = obj.delete()
+            counter = RECIPE_COUNTERS[model]
+            Recipe.objects.filter(id=pk).update(
+                **{counter: F(counter) - deleted}
+            )
+            if model is Favorite:
+                RecipeSimilarity.objects.mark_stale([pk])
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(
             {"Ошибка": "Рецепта нет или уже удален"},
@@ -108,34 +280,183 @@ class RecipeViewSet(viewsets.ModelViewSet):
         else:
             return self.delete_from(ShoppingCart, request.user, pk)
 
-    @action(detail=False, permission_classes=[IsAuthenticated])
-    def download_shopping_cart(self, request):
-        """Создает файл со списком покупок пользователя для скачивания."""
+    @transaction.atomic
+    def bulk_apply(self, model, request):
+        """Добавляет или удаляет рецепты из списка ids в указанной
+        модели одной транзакцией и возвращает результат для каждого id."""
 
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data["ids"]
         user = request.user
-        if not user.shopping_cart.exists():
-            return Response(status=status.HTTP_400_BAD_REQUEST)
+        counter = RECIPE_COUNTERS[model]
 
-        ingredients = (
-            RecipeIngredient.objects.filter(
-                recipe__in_shopping_cart__user=user
+        if request.method == "POST":
+            changed, results = add_relations(
+                model, user, "recipe_id", ids, Recipe.objects.all()
             )
-            .values("ingredient__name", "ingredient__measurement_unit")
-            .order_by("ingredient__name")
-            .annotate(amount=Sum("amount"))
+            if model is ShoppingCart and changed:
+                ShoppingCartIngredient.objects.apply_recipes(
+                    changed, user_id=user.id
+                )
+            delta = 1
+        else:
+            before_delete = None
+            if model is ShoppingCart:
+                def before_delete(removed):
+                    ShoppingCartIngredient.objects.apply_recipes(
+                        removed, sign=-1, user_id=user.id
+                    )
+            changed, results = remove_relations(
+                model, user, "recipe_id", ids, before_delete
+            )
+            delta = -1
+        if changed:
+            Recipe.objects.filter(id__in=changed).update(
+                **{counter: F(counter) + delta}
+            )
+            if model is Favorite:
+                RecipeSimilarity.objects.mark_stale(changed)
+        return Response(bulk_response_data(ids, results))
+
+    @action(
+        detail=False,
+        methods=["post", "delete"],
+        url_path="favorite",
+        permission_classes=[IsAuthenticated],
+    )
+    def favorite_bulk(self, request):
+        """Добавляет или удаляет несколько рецептов из избранного."""
+
+        return self.bulk_apply(Favorite, request)
+
+    @action(
+        detail=False,
+        methods=["post", "delete"],
+        url_path="shopping_cart",
+        permission_classes=[IsAuthenticated],
+    )
+    def shopping_cart_bulk(self, request):
+        """Добавляет или удаляет несколько рецептов из списка покупок."""
+
+        return self.bulk_apply(ShoppingCart, request)
+
+    @action(detail=False, renderer_classes=[JSONRenderer])
+    def match(self, request):
+        """Подбирает рецепты по имеющимся ингредиентам.
+
+        Параметры: ingredients - id ингредиентов (можно несколько раз),
+        max_missing - сколько ингредиентов рецепта может не хватать.
+        Рецепты отсортированы по числу недостающих ингредиентов, затем
+        по доле имеющихся, и дополнены полем match.
+        """
+
+        params = request.query_params
+        data = {"ingredients": params.getlist("ingredients")}
+        if "max_missing" in params:
+            data["max_missing"] = params["max_missing"]
+        serializer = RecipeMatchQuerySerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        rows = RecipeIngredientSet.objects.match(
+            serializer.validated_data["ingredients"],
+            serializer.validated_data["max_missing"],
+            MATCH_RESULTS_LIMIT,
+        )
+        paginator = CustomPagination()
+        page = paginator.paginate_queryset(rows, request, view=self)
+        recipes = self.get_recipes_in_order(
+            [recipe_id for recipe_id, _, _ in page]
+        )
+        extra = {
+            recipe_id: {
+                "match": {
+                    "matched": matched,
+                    "missing": len(missing),
+                    "missing_ingredients": missing,
+                }
+            }
+            for recipe_id, matched, missing in page
+        }
+        items = render_recipes(recipes, "card", extra)
+        return paginated_content(paginator.get_paginated_response([]), items)
+
+    @action(
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        renderer_classes=[JSONRenderer],
+    )
+    def timeline(self, request):
+        """Лента рецептов авторов, на которых подписан пользователь,
+        от новых к старым, с keyset-пагинацией по параметру cursor."""
+
+        paginator = TimelinePagination()
+        positions = paginator.paginate_positions(
+            partial(get_timeline, request.user.id), request
         )
+        recipes = self.get_recipes_in_order([pk for pk, _ in positions])
+        items = render_recipes(recipes, "card")
+        return paginated_content(paginator.get_paginated_response([]), items)
 
-        shopping_cart = f"Список покупок {user.get_full_name()}\n\n"
-        for ingredient in ingredients:
-            shopping_cart += (
-                f'{ingredient["ingredient__name"].capitalize()},'
-                f' {ingredient["amount"]}'
-                f' {ingredient["ingredient__measurement_unit"]}\n'
+    @action(detail=True, renderer_classes=[JSONRenderer])
+    def similar(self, request, pk):
+        """Похожие рецепты по убыванию сходства.
+
+        Списки заранее строит команда build_recipe_similarity, для
+        рецепта без построенного списка возвращается пустая выдача.
+        """
+
+        similar_ids = RecipeSimilarity.objects.get_similar_ids(pk)
+        if similar_ids is None:
+            get_object_or_404(Recipe, id=pk)
+            similar_ids = []
+        paginator = CustomPagination()
+        page = paginator.paginate_queryset(similar_ids, request, view=self)
+        items = render_recipes(self.get_recipes_in_order(page), "card")
+        return paginated_content(paginator.get_paginated_response([]), items)
+
+    def get_recipes_in_order(self, ids):
+        """Рецепты с флагами пользователя в порядке ids, удаленные
+        пропускаются."""
+
+        recipes = Recipe.objects.with_user_flags(self.request.user).in_bulk(
+            ids
+        )
+        return [recipes[pk] for pk in ids if pk in recipes]
+
+    @action(
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        renderer_classes=[
+            ShoppingCartTextRenderer,
+            ShoppingCartCSVRenderer,
+            ShoppingCartJSONRenderer,
+            ShoppingCartPDFRenderer,
+        ],
+    )
+    def download_shopping_cart(self, request):
+        """Отдает файл со списком покупок пользователя частями.
+
+        Формат выбирается параметром format: txt, csv, json или pdf.
+        """
+
+        user = request.user
+        ingredients = (
+            ShoppingCartIngredient.objects.filter(user=user)
+            .values(
+                "ingredient__name", "ingredient__measurement_unit", "amount"
             )
-        shopping_cart += f"\n\nFoodgram {datetime.today():%d-%m-%Y}"
+            .order_by("ingredient__name")
+            .iterator(chunk_size=SHOPPING_CART_CHUNK_SIZE)
+        )
+        first = next(ingredients, None)
+        if first is None:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
 
-        filename = f"{user}_shopping_cart.txt"
-        response = HttpResponse(shopping_cart, content_type="text/plain")
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(chain((first,), ingredients), user),
+            content_type=renderer.get_content_type(),
+        )
+        filename = renderer.get_filename(user)
         response["Content-Disposition"] = f"attachment; filename={filename}"
-
         return response
@@ -0,0 +1,112 @@
+import asyncio
+import contextvars
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections
+from django.http import FileResponse
+
+# Сколько байт тела потокового ответа держать в памяти, остальное
+# пишется во временный файл.
+SPOOL_MAX_SIZE = 1024 * 1024
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.DB_THREADS,
+                thread_name_prefix="db",
+            )
+    return _executor
+
+
+def spool_response(response):
+    """Записывает тело потокового ответа во временный файл и
+    возвращает FileResponse с теми же кодом и заголовками.
+
+    В памяти остается не больше SPOOL_MAX_SIZE байт тела.
+    """
+
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    try:
+        for chunk in response.streaming_content:
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    size = spool.tell()
+    spool.seek(0)
+    spooled = FileResponse(spool, status=response.status_code)
+    for header, value in response.items():
+        spooled[header] = value
+    spooled["Content-Length"] = str(size)
+    return spooled
+
+
+def run_view(view, request, *args, **kwargs):
+    """Выполняет синхронный вид в потоке пула и возвращает готовый ответ.
+
+    Соединение с БД остается у потока пула между запросами и, как в
+    обычном цикле запроса Django, закрывается до и после вызова, если
+    устарело или сломано. Ответ рендерится здесь, а тело потокового
+    ответа формируется здесь же через spool_response: Django 3.2
+    перебирает потоковый ответ прямо в цикле событий, где обращаться
+    к БД нельзя.
+    """
+
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if callable(getattr(response, "render", None)):
+            response.render()
+        if response.streaming:
+            response = spool_response(response)
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_view(view):
+    """Асинхронная обертка синхронного вида.
+
+    Под ASGI вид выполняется в пуле из DB_THREADS потоков, поэтому
+    медленный запрос не занимает цикл событий, а соединений с БД
+    в процессе не больше размера пула. Без цикла событий ASGI (WSGI,
+    тестовый клиент) вид выполняется в потоке запроса, как раньше.
+    """
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not isinstance(request, ASGIRequest):
+            return await sync_to_async(view, thread_sensitive=True)(
+                request, *args, **kwargs
+            )
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            get_executor(),
+            partial(context.run, run_view, view, request, *args, **kwargs),
+        )
+
+    return wrapper
+
+
+class AsyncViewSetMixin:
+    """Отдает действия ViewSet через async_view, если включены
+    ASYNC_VIEWS."""
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+        if not settings.ASYNC_VIEWS:
+            return view
+        return async_view(view)
@@ -0,0 +1,189 @@
+import hmac
+import os
+import re
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter as PrometheusCounter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# Метрики текущего запроса, их заполняет PerformanceMiddleware.
+current_metrics = ContextVar("current_metrics", default=None)
+
+FINGERPRINT_RULES = (
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"%s|\b\d+\b"), "?"),
+    (re.compile(r"\?(?:\s*,\s*\?)+"), "?, ..."),
+    (re.compile(r"\s+"), " "),
+)
+
+REQUEST_DURATION = Histogram(
+    "foodgram_request_duration_seconds",
+    "Время обработки запроса",
+    ["view"],
+)
+REQUEST_DB_QUERIES = Histogram(
+    "foodgram_request_db_queries",
+    "Количество SQL-запросов на один запрос к API",
+    ["view"],
+    buckets=(1, 2, 3, 5, 10, 20, 50, 100, 200, float("inf")),
+)
+REQUEST_DB_DURATION = Histogram(
+    "foodgram_request_db_duration_seconds",
+    "Время выполнения SQL-запросов",
+    ["view"],
+)
+REQUEST_SERIALIZER_DURATION = Histogram(
+    "foodgram_request_serializer_duration_seconds",
+    "Время сериализации ответа",
+    ["view"],
+)
+REQUESTS = PrometheusCounter(
+    "foodgram_requests",
+    "Количество запросов",
+    ["view", "status"],
+)
+
+
+def fingerprint(sql):
+    """SQL без литералов: запросы, отличающиеся только параметрами,
+    получают одинаковый отпечаток."""
+
+    for pattern, replacement in FINGERPRINT_RULES:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+class RequestMetrics:
+    """Время, SQL-запросы и время сериализации одного запроса.
+
+    Экземпляр хранится в current_metrics, record_query учитывает в нем
+    каждый выполненный SQL-запрос.
+    """
+
+    def __init__(self):
+        self.start = perf_counter()
+        self.view = "unresolved"
+        self.queries = []
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += perf_counter() - start
+            self.queries.append(sql)
+
+    @property
+    def duration(self):
+        return perf_counter() - self.start
+
+    def duplicated_queries(self, limit=5):
+        """Самые частые повторяющиеся отпечатки SQL, признак N+1."""
+
+        counts = Counter(fingerprint(sql) for sql in self.queries)
+        return [
+            (sql, count)
+            for sql, count in counts.most_common(limit)
+            if count > 1
+        ]
+
+    def observe(self, duration, status):
+        REQUEST_DURATION.labels(self.view).observe(duration)
+        REQUEST_DB_QUERIES.labels(self.view).observe(len(self.queries))
+        REQUEST_DB_DURATION.labels(self.view).observe(self.db_time)
+        REQUEST_SERIALIZER_DURATION.labels(self.view).observe(
+            self.serializer_time
+        )
+        REQUESTS.labels(self.view, str(status)).inc()
+
+
+def record_query(execute, sql, params, many, context):
+    """Учитывает SQL-запрос в метриках текущего запроса, если они есть.
+
+    Метрики берутся из current_metrics, поэтому запросы учитываются и
+    в потоке, где выполняется вид, и в потоках пула асинхронных видов.
+    """
+
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def record_queries(sender=None, connection=None, **kwargs):
+    """Подключает record_query к соединению с БД один раз."""
+
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def measure_serializer():
+    """Учитывает время сериализации в метриках текущего запроса.
+
+    Вложенные сериализаторы не учитываются повторно.
+    """
+
+    metrics = current_metrics.get()
+    if metrics is None or metrics.serializing:
+        yield
+        return
+    metrics.serializing = True
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer_time += perf_counter() - start
+        metrics.serializing = False
+
+
+class TimedSerializerMixin:
+    """Добавляет время to_representation в метрики запроса."""
+
+    def to_representation(self, instance):
+        with measure_serializer():
+            return super().to_representation(instance)
+
+
+def get_registry():
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def metrics_view(request):
+    """Метрики в формате Prometheus.
+
+    Если задан METRICS_TOKEN, требуется заголовок
+    Authorization: Bearer <токен>.
+    """
+
+    token = settings.METRICS_TOKEN
+    if token and not hmac.compare_digest(
+        request.headers.get("Authorization", "").encode(),
+        f"Bearer {token}".encode(),
+    ):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST
+    )
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+
+from django.conf import settings
+from django.db import connection
+
+from .metrics import RequestMetrics, current_metrics, record_queries
+
+logger = logging.getLogger("foodgram.performance")
+
+
+def get_view_name(view_func, method):
+    """Имя вида для меток метрик, например RecipeViewSet.list."""
+
+    view_class = getattr(view_func, "cls", None)
+    if view_class is None:
+        return f"{view_func.__module__}.{view_func.__name__}"
+    actions = getattr(view_func, "actions", None) or {}
+    action = actions.get(method.lower(), method.lower())
+    return f"{view_class.__name__}.{action}"
+
+
+class PerformanceMiddleware:
+    """Измеряет время запроса, SQL-запросы и время сериализации.
+
+    Результат отдается в заголовке Server-Timing и в метриках
+    Prometheus. Медленные запросы и запросы с большим числом SQL
+    записываются в лог foodgram.performance с повторяющимися
+    отпечатками SQL. Для потоковых ответов учитывается только время
+    до начала передачи тела.
+
+    Работает и в синхронной (WSGI), и в асинхронной (ASGI) цепочке
+    обработчиков, чтобы под ASGI не переводить весь запрос в общий
+    поток синхронного кода.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            record_queries(connection=connection)
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        duration = metrics.duration
+        metrics.observe(duration, response.status_code)
+        response["Server-Timing"] = (
+            f"total;dur={duration * 1000:.1f}, "
+            f"db;dur={metrics.db_time * 1000:.1f};"
+            f'desc="{len(metrics.queries)} queries", '
+            f"serializer;dur={metrics.serializer_time * 1000:.1f}"
+        )
+        if (
+            duration * 1000 >= settings.SLOW_REQUEST_THRESHOLD_MS
+            or len(metrics.queries) >= settings.SLOW_REQUEST_QUERY_COUNT
+        ):
+            self.log_slow_request(request, response, metrics, duration)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = current_metrics.get()
+        if metrics is not None:
+            metrics.view = get_view_name(view_func, request.method)
+
+    def log_slow_request(self, request, response, metrics, duration):
+        duplicates = "".join(
+            f"\n  {count} x {sql[:300]}"
+            for sql, count in metrics.duplicated_queries()
+        )
+        logger.warning(
+            "Медленный запрос %s %s (%s) -> %s: %.1f мс, SQL: %d за %.1f мс,"
+            " сериализация %.1f мс%s",
+            request.method,
+            request.get_full_path(),
+            metrics.view,
+            response.status_code,
+            duration * 1000,
+            len(metrics.queries),
+            metrics.db_time * 1000,
+            metrics.serializer_time * 1000,
+            duplicates,
+        )
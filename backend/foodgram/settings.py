@@ -25,6 +25,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework.authtoken',
     'rest_framework',
     'django_filters',
@@ -32,6 +33,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'foodgram.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -70,9 +72,27 @@ DATABASES = {
         "PASSWORD": os.getenv("POSTGRES_PASSWORD", ""),
         "HOST": os.getenv("DB_HOST", "127.0.0.1"),
         "PORT": os.getenv("DB_PORT", 5432),
+        "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", 60)),
     }
 }
 
+# Общий кэш всех воркеров. Однократное вычисление ответов в api.cache
+# держится на атомарном cache.add: в Redis и Memcached оно атомарно
+# между процессами, в LocMemCache - только внутри процесса, а в
+# FileBasedCache не атомарно совсем.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django_redis.cache.RedisCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'redis://127.0.0.1:6379/1'),
+    }
+}
+
+# Время жизни кэшированных ответов для анонимных пользователей, в
+# секундах. Сортировка по популярности обновляется не чаще.
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', 300))
+
 AUTH_USER_MODEL = 'users.User'
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -108,6 +128,22 @@ STATIC_ROOT = BASE_DIR / "collected_static"
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+DEFAULT_FILE_STORAGE = 'recipes.storage.ContentAddressedStorage'
+
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
+# Потоки, в которых под ASGI выполняются асинхронные виды. У каждого
+# потока свое постоянное соединение с БД, поэтому воркер uvicorn
+# держит не больше DB_THREADS + 1 соединений.
+DB_THREADS = int(os.getenv('DB_THREADS', 8))
+
+# Асинхронные виды для запуска под ASGI (foodgram.asgi). Точка входа
+# WSGI (foodgram.wsgi) по умолчанию их выключает: там они только
+# добавляют переход между потоками.
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'True') == 'True'
+
+IMAGE_RENDITION_FORMAT = os.getenv('IMAGE_RENDITION_FORMAT', 'WEBP')
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
@@ -135,3 +171,32 @@ DJOSER = {
         'user': ['rest_framework.permissions.AllowAny'],
     },
 }
+
+SHOPPING_CART_PDF_FONT = os.getenv(
+    'SHOPPING_CART_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+)
+
+SLOW_REQUEST_THRESHOLD_MS = int(os.getenv('SLOW_REQUEST_THRESHOLD_MS', 500))
+
+SLOW_REQUEST_QUERY_COUNT = int(os.getenv('SLOW_REQUEST_QUERY_COUNT', 30))
+
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+BULK_MAX_IDS = int(os.getenv('BULK_MAX_IDS', 200))
+
+TIMELINE_CACHE_TIMEOUT = int(os.getenv('TIMELINE_CACHE_TIMEOUT', 30))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'foodgram.performance': {
+            'handlers': ['console'],
+            'level': os.getenv('PERFORMANCE_LOG_LEVEL', 'WARNING'),
+        },
+    },
+}
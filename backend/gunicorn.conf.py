@@ -0,0 +1,15 @@
+import os
+
+# asgi - воркеры uvicorn и асинхронные виды, wsgi - синхронные
+# воркеры gunicorn. Режимы можно сравнить командой benchmark_servers.
+SERVER_MODE = os.getenv('SERVER_MODE', 'asgi')
+
+bind = '0.0.0.0:8000'
+
+if SERVER_MODE == 'asgi':
+    wsgi_app = 'foodgram.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+elif SERVER_MODE == 'wsgi':
+    wsgi_app = 'foodgram.wsgi:application'
+else:
+    raise ValueError(f'Неизвестный SERVER_MODE: {SERVER_MODE}')
@@ -6,7 +6,10 @@ from .models import (
     Ingredient,
     Recipe,
     RecipeIngredient,
+    RecipeIngredientSet,
+    RecipeSimilarity,
     ShoppingCart,
+    ShoppingCartIngredient,
     Tag,
 )
 
@@ -30,13 +33,24 @@ class RecipeIngredientInline(admin.TabularInline):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ("pk", "name", "author", "in_favorites")
+    list_display = ("pk", "name", "author", "in_favorites", "in_carts")
     list_filter = ("author", "name", "tags")
     inlines = [RecipeIngredientInline]
 
-    @display(description="Количество в избранных")
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        RecipeIngredientSet.objects.refresh([form.instance.id])
+        RecipeSimilarity.objects.mark_stale([form.instance.id])
+
+    @display(description="Количество в избранных", ordering="favorites_count")
     def in_favorites(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
+
+    @display(
+        description="Количество в списках покупок", ordering="in_carts_count"
+    )
+    def in_carts(self, obj):
+        return obj.in_carts_count
 
 
 @admin.register(Favorite)
@@ -47,3 +61,8 @@ class FavoriteAdmin(admin.ModelAdmin):
 @admin.register(ShoppingCart)
 class ShoppingCartAdmin(admin.ModelAdmin):
     list_display = ("id", "user")
+
+
+@admin.register(ShoppingCartIngredient)
+class ShoppingCartIngredientAdmin(admin.ModelAdmin):
+    list_display = ("id", "user", "ingredient", "amount")
@@ -0,0 +1,127 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps, features
+
+from .models import Recipe
+from .storage import lock_content
+from api.cache import recipes_cache
+
+logger = logging.getLogger(__name__)
+
+# Имя варианта изображения и максимальный размер его сторон.
+RENDITIONS = {
+    "thumbnail": (160, 160),
+    "card": (600, 600),
+    "full": (1280, 1280),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS,
+                thread_name_prefix="recipe-images",
+            )
+    return _executor
+
+
+def get_rendition_format():
+    """WEBP, если Pillow собран с его поддержкой, иначе JPEG."""
+
+    image_format = settings.IMAGE_RENDITION_FORMAT.upper()
+    if image_format == "WEBP" and not features.check("webp"):
+        return "JPEG"
+    return image_format
+
+
+def get_rendition_url(recipe, name):
+    """URL варианта изображения или оригинала, пока вариант не готов."""
+
+    path = recipe.image_renditions.get(name)
+    if path:
+        return default_storage.url(path)
+    return recipe.image.url
+
+
+def make_renditions(recipe_id):
+    """Строит уменьшенные копии изображения рецепта и сохраняет
+    их пути в Recipe.image_renditions."""
+
+    recipe = Recipe.objects.filter(id=recipe_id).only("id", "image").first()
+    if recipe is None or not recipe.image:
+        return
+    image_format = get_rendition_format()
+    extension = "webp" if image_format == "WEBP" else "jpg"
+    renditions = {}
+    with recipe.image.open("rb") as file, Image.open(file) as original:
+        original = ImageOps.exif_transpose(original).convert(
+            "RGBA" if image_format == "WEBP" else "RGB"
+        )
+        for name, size in RENDITIONS.items():
+            image = original.copy()
+            image.thumbnail(size, Image.LANCZOS)
+            buffer = BytesIO()
+            image.save(buffer, image_format, quality=80)
+            renditions[name] = default_storage.save(
+                f"recipes/renditions/{name}.{extension}",
+                ContentFile(buffer.getvalue()),
+            )
+    updated = Recipe.objects.filter(
+        id=recipe_id, image=recipe.image.name
+    ).update(image_renditions=renditions)
+    if updated:
+        recipes_cache.invalidate([recipe_id])
+
+
+def delete_unused_image(name, renditions):
+    """Удаляет файл изображения и его варианты, если на этот файл
+    больше не ссылается ни один рецепт.
+
+    Проверка и удаление выполняются под блокировкой lock_content:
+    загрузка того же содержимого ждет окончания удаления, а удаление -
+    коммита рецепта, который уже сослался на существующий файл.
+    """
+
+    if not name:
+        return
+    with transaction.atomic():
+        lock_content(name)
+        if Recipe.objects.filter(image=name).exists():
+            return
+        for path in (name, *renditions.values()):
+            default_storage.delete(path)
+
+
+def schedule_image_cleanup(name, renditions):
+    transaction.on_commit(lambda: delete_unused_image(name, renditions))
+
+
+def make_renditions_in_background(recipe_id):
+    try:
+        make_renditions(recipe_id)
+    except Exception:
+        logger.exception("Не удалось обработать изображение %s", recipe_id)
+    finally:
+        connection.close()
+
+
+def schedule_renditions(recipe_id):
+    """Ставит обработку изображения в пул потоков после коммита."""
+
+    transaction.on_commit(
+        lambda: get_executor().submit(
+            make_renditions_in_background, recipe_id
+        )
+    )
@@ -0,0 +1,48 @@
+import os
+import time
+
+from django.core.management import BaseCommand, CommandError
+
+from recipes.similarity import CHUNK_SIZE, build_similarity
+
+
+class Command(BaseCommand):
+    help = (
+        "Расчет похожих рецептов по ингредиентам, тегам и избранному. "
+        "По умолчанию пересчитываются только списки, затронутые "
+        "изменениями с прошлого запуска."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Пересчитать списки всех рецептов",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Количество процессов для расчета",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=CHUNK_SIZE,
+            help=f"Рецептов в одной порции (по умолчанию {CHUNK_SIZE})",
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            count = build_similarity(
+                options["full"], options["workers"], options["chunk_size"]
+            )
+        except ValueError as error:
+            raise CommandError(str(error))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Пересчитано рецептов: {count} "
+                f"за {time.perf_counter() - start:.1f} с"
+            )
+        )
@@ -0,0 +1,230 @@
+import csv
+import io
+import json
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from psycopg2.extras import execute_values
+
+from api.cache import ingredients_cache, tags_cache
+from recipes.models import Ingredient, Tag
+
+# Модель, поля уникального ключа, обновляемые при конфликте поля
+# и кэш справочника, который нужно сбросить после импорта.
+TARGETS = {
+    "ingredients": (
+        Ingredient,
+        ("name", "measurement_unit"),
+        (),
+        ingredients_cache,
+    ),
+    "tags": (Tag, ("slug",), ("name", "color"), tags_cache),
+}
+
+
+JSON_WHITESPACE = " \t\n\r"
+# Состояния чтения JSON: start - начало файла, first - сразу после "[",
+# item - после ",", separator - после элемента массива, end - после "]",
+# lines - JSON Lines. Переходы по разделителям, остальные символы
+# начинают очередной элемент.
+JSON_TRANSITIONS = {
+    ("start", "["): "first",
+    ("first", "]"): "end",
+    ("separator", ","): "item",
+    ("separator", "]"): "end",
+}
+
+
+def iter_csv(file):
+    yield from csv.DictReader(file)
+
+
+def skip_json_separators(buffer, index, state, offset):
+    """Пропускает пробельные символы и разделители JSON с позиции index
+    до начала очередного элемента или конца буфера.
+
+    Возвращает новую позицию и состояние чтения, для лишних разделителей
+    вызывает ValueError с позицией в файле (offset - позиция начала
+    буфера).
+    """
+
+    while index < len(buffer):
+        char = buffer[index]
+        if char in JSON_WHITESPACE:
+            index += 1
+        elif (state, char) in JSON_TRANSITIONS:
+            state = JSON_TRANSITIONS[state, char]
+            index += 1
+        elif state in ("separator", "end") or char in ",]":
+            raise ValueError(
+                f"Неожиданный символ {char!r} в позиции {offset + index}"
+            )
+        else:
+            return index, "lines" if state == "start" else state
+    return index, state
+
+
+def iter_json(file, chunk_size=64 * 1024):
+    """Поочередно читает объекты JSON-массива, не загружая файл целиком.
+
+    Файлы без открывающей скобки массива читаются как JSON Lines:
+    объекты, разделенные пробельными символами. Буфер сдвигается
+    один раз на каждый прочитанный фрагмент файла.
+    """
+
+    decoder = json.JSONDecoder()
+    buffer = ""
+    index = offset = 0
+    state = "start"
+    chunk = True
+    while chunk:
+        chunk = file.read(chunk_size)
+        offset += index
+        buffer = buffer[index:] + chunk
+        index = 0
+        while True:
+            index, state = skip_json_separators(buffer, index, state, offset)
+            if index == len(buffer):
+                break
+            try:
+                item, end = decoder.raw_decode(buffer, index)
+            except json.JSONDecodeError:
+                if not chunk:
+                    raise
+                break
+            if end == len(buffer) and chunk:
+                # Число в конце буфера может продолжаться в следующем
+                # фрагменте.
+                break
+            yield item
+            index = end
+            if state != "lines":
+                state = "separator"
+    if state in ("first", "item", "separator"):
+        raise ValueError("JSON-массив не закрыт")
+
+
+READERS = {".csv": iter_csv, ".json": iter_json, ".jsonl": iter_json}
+
+
+class Command(BaseCommand):
+    help = (
+        "Импорт справочников из csv/json файлов пакетами с обновлением "
+        "существующих записей. Повторный запуск не создает дублей."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("target", choices=TARGETS)
+        parser.add_argument("path", help="Путь к csv, json или jsonl файлу")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--copy",
+            action="store_true",
+            help="Загружать пакеты через COPY во временную таблицу",
+        )
+
+    def handle(self, *args, **options):
+        model, key_fields, update_fields, cache = TARGETS[options["target"]]
+        path = Path(options["path"])
+        reader = READERS.get(path.suffix)
+        if reader is None:
+            raise CommandError(f"Неподдерживаемый формат файла: {path}")
+        if options["copy"] and connection.vendor != "postgresql":
+            raise CommandError("COPY доступен только для PostgreSQL")
+
+        fields = key_fields + update_fields
+        upsert = self.copy_batch if options["copy"] else self.insert_batch
+        total = written = 0
+        start = time.perf_counter()
+        try:
+            with open(path, encoding="utf-8") as file:
+                rows = (
+                    tuple(row[field] for field in fields)
+                    for row in reader(file)
+                )
+                while True:
+                    batch = list(islice(rows, options["batch_size"]))
+                    if not batch:
+                        break
+                    total += len(batch)
+                    batch = list(
+                        {row[: len(key_fields)]: row for row in batch}.values()
+                    )
+                    with transaction.atomic():
+                        written += upsert(
+                            model, key_fields, update_fields, batch
+                        )
+                    self.report(total, written, start)
+        except (OSError, KeyError, ValueError) as error:
+            raise CommandError(f"Ошибка импорта: {error!r}")
+        finally:
+            cache.bump()
+        self.stdout.write(self.style.SUCCESS(f"Импорт {path} завершен"))
+
+    def report(self, total, written, start):
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"Прочитано {total}, записано {written},"
+            f" {total / elapsed if elapsed else 0:.0f} строк/с"
+        )
+
+    def get_conflict_sql(self, table, key_fields, update_fields):
+        target = ", ".join(key_fields)
+        if not update_fields:
+            return f"ON CONFLICT ({target}) DO NOTHING"
+        updates = ", ".join(
+            f"{field} = EXCLUDED.{field}" for field in update_fields
+        )
+        condition = " OR ".join(
+            f"{table}.{field} IS DISTINCT FROM EXCLUDED.{field}"
+            for field in update_fields
+        )
+        return (
+            f"ON CONFLICT ({target}) DO UPDATE SET {updates} WHERE {condition}"
+        )
+
+    def insert_batch(self, model, key_fields, update_fields, batch):
+        fields = key_fields + update_fields
+        if connection.vendor != "postgresql":
+            created = model.objects.bulk_create(
+                (model(**dict(zip(fields, row))) for row in batch),
+                ignore_conflicts=True,
+            )
+            return len(created)
+
+        table = model._meta.db_table
+        conflict = self.get_conflict_sql(table, key_fields, update_fields)
+        with connection.cursor() as cursor:
+            execute_values(
+                cursor.cursor,
+                f"INSERT INTO {table} ({', '.join(fields)}) VALUES %s "
+                f"{conflict}",
+                batch,
+                page_size=len(batch),
+            )
+            return cursor.cursor.rowcount
+
+    def copy_batch(self, model, key_fields, update_fields, batch):
+        fields = ", ".join(key_fields + update_fields)
+        table = model._meta.db_table
+        conflict = self.get_conflict_sql(table, key_fields, update_fields)
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(batch)
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TEMP TABLE import_batch ON COMMIT DROP "
+                f"AS SELECT {fields} FROM {table} WITH NO DATA"
+            )
+            cursor.cursor.copy_expert(
+                f"COPY import_batch ({fields}) FROM STDIN WITH (FORMAT csv)",
+                buffer,
+            )
+            cursor.execute(
+                f"INSERT INTO {table} ({fields}) "
+                f"SELECT {fields} FROM import_batch {conflict}"
+            )
+            return cursor.rowcount
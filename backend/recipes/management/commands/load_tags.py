@@ -1,15 +1,15 @@
-from django.core.management import BaseCommand
-
-from recipes.models import Tag
+from django.conf import settings
+from django.core.management import BaseCommand, call_command
 
 
 class Command(BaseCommand):
     help = 'Заполняем тэги'
 
     def handle(self, *args, **kwargs):
-        data = [
-            {'name': 'Завтрак', 'color': '#ed7c26', 'slug': 'breakfast'},
-            {'name': 'Обед', 'color': '#24039b', 'slug': 'lunch'},
-            {'name': 'Ужин', 'color': '#12a12a', 'slug': 'dinner'}]
-        Tag.objects.bulk_create(Tag(**tag) for tag in data)
+        call_command(
+            'import_data',
+            'tags',
+            f'{settings.BASE_DIR}/data/tags.json',
+            stdout=self.stdout,
+        )
         self.stdout.write(self.style.SUCCESS('Все тэги загружены'))
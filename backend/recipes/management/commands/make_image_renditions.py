@@ -0,0 +1,31 @@
+from django.core.management import BaseCommand
+
+from recipes.images import make_renditions
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Создание уменьшенных копий изображений рецептов"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Пересоздать варианты для всех рецептов",
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.order_by("id")
+        if not options["all"]:
+            recipes = recipes.filter(image_renditions={})
+        done = 0
+        for recipe_id in recipes.values_list("id", flat=True).iterator():
+            try:
+                make_renditions(recipe_id)
+            except (OSError, ValueError) as error:
+                self.stderr.write(f"Рецепт {recipe_id}: {error}")
+                continue
+            done += 1
+        self.stdout.write(
+            self.style.SUCCESS(f"Обработано изображений: {done}")
+        )
@@ -0,0 +1,21 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes.models import RecipeIngredientSet
+
+
+class Command(BaseCommand):
+    help = (
+        "Перестройка индекса подбора рецептов по ингредиентам "
+        "с пересчетом редкости ингредиентов"
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            RecipeIngredientSet.objects.rebuild()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Проиндексировано рецептов: "
+                f"{RecipeIngredientSet.objects.count()}"
+            )
+        )
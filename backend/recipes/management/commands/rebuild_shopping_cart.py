@@ -0,0 +1,49 @@
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import ShoppingCartIngredient
+
+
+class Command(BaseCommand):
+    help = "Пересчет агрегата списков покупок и проверка его расхождений"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Только сравнить агрегат с корзинами, не пересчитывая",
+        )
+
+    def get_drift(self):
+        live = {
+            (row["user"], row["ingredient"]): row["amount"]
+            for row in ShoppingCartIngredient.objects.live_totals().iterator()
+        }
+        stored = {
+            (row["user"], row["ingredient"]): row["amount"]
+            for row in ShoppingCartIngredient.objects.values(
+                "user", "ingredient", "amount"
+            ).iterator()
+        }
+        return [
+            (key, stored.get(key), live.get(key))
+            for key in live.keys() | stored.keys()
+            if stored.get(key) != live.get(key)
+        ]
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            drift = self.get_drift()
+            for (user, ingredient), stored, live in sorted(drift):
+                self.stdout.write(
+                    f"user={user} ingredient={ingredient}"
+                    f" stored={stored} live={live}"
+                )
+            if drift:
+                raise CommandError(f"Найдено расхождений: {len(drift)}")
+            self.stdout.write(self.style.SUCCESS("Расхождений нет"))
+            return
+
+        with transaction.atomic():
+            ShoppingCartIngredient.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS("Списки покупок пересчитаны"))
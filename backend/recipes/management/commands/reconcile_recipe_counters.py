@@ -0,0 +1,40 @@
+from django.core.management import BaseCommand, CommandError
+
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        "Сверка счетчиков избранного и списков покупок рецептов "
+        "с фактическими данными и исправление расхождений"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Только вывести расхождения, не исправляя их",
+        )
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            drift = Recipe.objects.counters_drift().order_by("id")
+            total = 0
+            for recipe in drift.iterator():
+                total += 1
+                self.stdout.write(
+                    f"recipe={recipe.id}"
+                    f" favorites={recipe.favorites_count}"
+                    f"/{recipe.live_favorites_count}"
+                    f" carts={recipe.in_carts_count}"
+                    f"/{recipe.live_in_carts_count}"
+                )
+            if total:
+                raise CommandError(f"Найдено расхождений: {total}")
+            self.stdout.write(self.style.SUCCESS("Расхождений нет"))
+            return
+
+        fixed = Recipe.objects.reconcile_counters()
+        self.stdout.write(
+            self.style.SUCCESS(f"Исправлено рецептов: {fixed}")
+        )
@@ -0,0 +1,68 @@
+import os
+import time
+
+from django.core.management import BaseCommand, CommandError
+
+from api.cache import ingredients_cache, tags_cache
+from recipes.seeding import DEFAULT_SIZES, seed_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Генерация синтетических пользователей, рецептов и связей через "
+        "COPY для нагрузочного тестирования. Данные добавляются к "
+        "существующим."
+    )
+
+    def add_arguments(self, parser):
+        for name, default in DEFAULT_SIZES.items():
+            parser.add_argument(
+                f"--{name.replace('_', '-')}",
+                type=int,
+                default=default,
+                dest=f"size_{name}",
+                help=f"Размер набора данных: {name} (по умолчанию {default})",
+            )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help="Начальное значение генератора случайных чисел",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Количество процессов для генерации связей",
+        )
+        parser.add_argument(
+            "--zipf",
+            type=float,
+            default=1.1,
+            help="Показатель закона Ципфа для популярности рецептов, "
+            "авторов и ингредиентов",
+        )
+
+    def handle(self, *args, **options):
+        sizes = {name: options[f"size_{name}"] for name in DEFAULT_SIZES}
+        start = time.perf_counter()
+        try:
+            counts = seed_dataset(
+                sizes, options["seed"], options["workers"], options["zipf"]
+            )
+        except ValueError as error:
+            raise CommandError(str(error))
+        finally:
+            tags_cache.bump()
+            ingredients_cache.bump()
+
+        elapsed = time.perf_counter() - start
+        total = sum(counts.values())
+        for name, count in counts.items():
+            self.stdout.write(f"{name}: {count}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Создано {total} строк за {elapsed:.1f} с"
+                f" ({total / elapsed:.0f} строк/с)"
+            )
+        )
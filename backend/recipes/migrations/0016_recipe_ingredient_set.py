@@ -0,0 +1,74 @@
+# Generated by Django 3.2.3 on 2026-10-18 21:55
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Начальное заполнение индекса, как RecipeIngredientSet.objects.rebuild()
+# при MATCH_PREFIX_SIZE = 4.
+FILL_INDEX_SQL = """
+UPDATE recipes_ingredient ingredient
+SET match_rank = ranked.rank
+FROM (
+    SELECT ingredient.id,
+           row_number() OVER (
+               ORDER BY count(item.id), ingredient.id
+           ) AS rank
+    FROM recipes_ingredient ingredient
+    LEFT JOIN recipes_recipeingredient item
+      ON item.ingredient_id = ingredient.id
+    GROUP BY ingredient.id
+) ranked
+WHERE ranked.id = ingredient.id;
+
+INSERT INTO recipes_recipeingredientset (recipe_id, ingredient_ids, prefix_keys)
+SELECT recipe_id, ingredient_ids,
+       ARRAY(
+           SELECT prefix.id * 4 + prefix.position - 1
+           FROM unnest(rarest[1:4]) WITH ORDINALITY prefix(id, position)
+       )
+FROM (
+    SELECT item.recipe_id,
+           array_agg(item.ingredient_id ORDER BY item.ingredient_id)
+               AS ingredient_ids,
+           array_agg(item.ingredient_id
+                     ORDER BY ingredient.match_rank NULLS FIRST,
+                              ingredient.id) AS rarest
+    FROM recipes_recipeingredient item
+    JOIN recipes_ingredient ingredient ON ingredient.id = item.ingredient_id
+    GROUP BY item.recipe_id
+) recipe;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeIngredientSet',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ingredient_set', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('ingredient_ids', django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), size=None, verbose_name='Ингредиенты')),
+                ('prefix_keys', django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), size=None, verbose_name='Ключи префикса')),
+            ],
+            options={
+                'verbose_name': 'Набор ингредиентов рецепта',
+                'verbose_name_plural': 'Наборы ингредиентов рецептов',
+            },
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='match_rank',
+            field=models.PositiveIntegerField(editable=False, null=True, verbose_name='Порядок в индексе подбора'),
+        ),
+        migrations.AddIndex(
+            model_name='recipeingredientset',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['prefix_keys'], name='recipe_ingredient_prefix_idx'),
+        ),
+        migrations.RunSQL(FILL_INDEX_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.3 on 2026-10-18 22:50
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0017_recipe_author_pub_date_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeSimilarity',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='similarity', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('similar_ids', django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), size=None, verbose_name='Похожие рецепты')),
+                ('stale_since', models.DateTimeField(editable=False, null=True, verbose_name='Устарел')),
+            ],
+            options={
+                'verbose_name': 'Похожие рецепты',
+                'verbose_name_plural': 'Похожие рецепты',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recipesimilarity',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['similar_ids'], name='recipe_similar_ids_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipesimilarity',
+            index=models.Index(condition=models.Q(('stale_since__isnull', False)), fields=['stale_since'], name='recipe_similarity_stale_idx'),
+        ),
+    ]
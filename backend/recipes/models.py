@@ -1,6 +1,65 @@
+import html
+
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import (
+    SearchHeadline,
+    SearchQuery,
+    SearchRank,
+    SearchVectorField,
+)
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
-from users.models import User
+from django.db import connection, models
+from django.db.models import (
+    Count,
+    Exists,
+    F,
+    OuterRef,
+    Prefetch,
+    Subquery,
+    Value,
+    Window,
+)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce, RowNumber
+from users.models import Subscription, User
+
+# С какого числа подписок лента читается по общему индексу даты
+# публикации, а не слиянием лент отдельных авторов.
+TIMELINE_FANOUT_THRESHOLD = 500
+
+# Конфигурация полнотекстового поиска рецептов. Используется также
+# в триггере, заполняющем Recipe.search_vector (миграция 0015).
+SEARCH_CONFIG = "russian"
+# ts_headline отмечает совпадения управляющими символами STX и ETX:
+# текст экранируется для HTML уже после подсветки, затем отметки
+# заменяются тегами mark.
+SEARCH_HIGHLIGHT_MARKS = {"\x02": "<mark>", "\x03": "</mark>"}
+SEARCH_HIGHLIGHT_OPTIONS = {
+    "start_sel": "\x02",
+    "stop_sel": "\x03",
+    "max_words": 35,
+    "min_words": 15,
+    "max_fragments": 3,
+}
+
+
+def make_highlight_html(headline):
+    """Экранирует результат ts_headline и подсвечивает совпадения
+    тегом mark."""
+
+    if headline is None:
+        return None
+    headline = html.escape(headline)
+    for mark, tag in SEARCH_HIGHLIGHT_MARKS.items():
+        headline = headline.replace(mark, tag)
+    return headline
+
+
+def make_search_query(value):
+    """Запрос в синтаксисе поисковиков: слова, "фразы", -исключения, or."""
+
+    return SearchQuery(value, config=SEARCH_CONFIG, search_type="websearch")
 
 
 class Tag(models.Model):
@@ -41,6 +100,8 @@ class Ingredient(models.Model):
     Поля:
     - name (str): Название ингредиента.
     - measurement_unit (str): Единицы измерения.
+    - match_rank (int): Место по редкости в индексе подбора рецептов
+      (RecipeIngredientSet), пересчитывается при полной перестройке.
     """
 
     name = models.CharField(
@@ -52,6 +113,9 @@ class Ingredient(models.Model):
         max_length=200,
         verbose_name="Единицы измерения",
     )
+    match_rank = models.PositiveIntegerField(
+        "Порядок в индексе подбора", null=True, editable=False
+    )
 
     class Meta:
         verbose_name = "Ингредиент"
@@ -62,11 +126,248 @@ class Ingredient(models.Model):
                 fields=["name", "measurement_unit"], name="unique_name_unit"
             )
         ]
+        indexes = [
+            GinIndex(
+                fields=["name"],
+                name="ingredient_name_trgm",
+                opclasses=["gin_trgm_ops"],
+            )
+        ]
 
     def __str__(self):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    """QuerySet рецептов с подготовкой данных для сериализации."""
+
+    def with_related(self):
+        """Подтягивает автора, теги и ингредиенты фиксированным числом
+        запросов."""
+
+        return self.select_related("author").prefetch_related(
+            "tags",
+            Prefetch(
+                "recipe_ingredients",
+                queryset=RecipeIngredient.objects.select_related(
+                    "ingredient"
+                ),
+            ),
+        )
+
+    def with_user_flags(self, user):
+        """Аннотирует флаги избранного, списка покупок и подписки
+        на автора для пользователя."""
+
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+                author_is_subscribed=Value(False),
+            )
+        return self.annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+            author_is_subscribed=Exists(
+                Subscription.objects.filter(
+                    user=user, author=OuterRef("author")
+                )
+            ),
+        )
+
+    def search(self, value):
+        """Полнотекстовый поиск по названию и описанию с сортировкой
+        по релевантности.
+
+        Совпадения выбираются по GIN-индексу recipe_search_vector_idx,
+        ранг считается по сохраненному search_vector без повторного
+        разбора текста. Совпадения в названии весят больше.
+        """
+
+        query = make_search_query(value)
+        return (
+            self.filter(search_vector=query)
+            .annotate(search_rank=SearchRank(F("search_vector"), query))
+            .order_by("-search_rank", "-pub_date", "-id")
+        )
+
+    def search_highlights(self, value):
+        """Названия и фрагменты описаний с подсвеченными совпадениями:
+        {id: {"name": ..., "text": ...}}. Значения - экранированный HTML,
+        в котором размечены только совпадения.
+
+        ts_headline разбирает текст заново, поэтому вызывается только
+        для рецептов одной страницы.
+        """
+
+        query = make_search_query(value)
+        rows = self.annotate(
+            name_headline=SearchHeadline(
+                "name",
+                query,
+                config=SEARCH_CONFIG,
+                highlight_all=True,
+                start_sel=SEARCH_HIGHLIGHT_OPTIONS["start_sel"],
+                stop_sel=SEARCH_HIGHLIGHT_OPTIONS["stop_sel"],
+            ),
+            text_headline=SearchHeadline(
+                "text", query, config=SEARCH_CONFIG, **SEARCH_HIGHLIGHT_OPTIONS
+            ),
+        ).values_list("id", "name_headline", "text_headline")
+        return {
+            pk: {
+                "name": make_highlight_html(name),
+                "text": make_highlight_html(text),
+            }
+            for pk, name, text in rows
+        }
+
+    def latest_per_author(self, author_ids, limit):
+        """Возвращает не более limit последних рецептов каждого автора
+        одним запросом с оконной функцией ROW_NUMBER."""
+
+        ranked = (
+            self.model.objects.filter(author__in=author_ids)
+            .annotate(
+                row_number=Window(
+                    expression=RowNumber(),
+                    partition_by=[F("author_id")],
+                    order_by=[F("pub_date").desc(), F("id").desc()],
+                )
+            )
+            .order_by()
+            .values("id", "row_number")
+        )
+        sql, params = ranked.query.sql_with_params()
+        return self.filter(
+            id__in=RawSQL(
+                f"SELECT ranked.id FROM ({sql}) ranked "
+                "WHERE ranked.row_number <= %s",
+                (*params, limit),
+            )
+        )
+
+    def followed_timeline(self, user_id, position, limit):
+        """Последние рецепты авторов, на которых подписан пользователь:
+        список пар (id, pub_date) по убыванию (pub_date, id), начиная
+        после позиции position = (pub_date, id).
+
+        При небольшом числе подписок для каждого автора берется
+        не больше limit рецептов по индексу recipe_author_pub_date_idx,
+        и результаты сливаются. При TIMELINE_FANOUT_THRESHOLD подписок
+        и больше лента читается по индексу recipe_pub_date_id_idx
+        с проверкой подписки: рецептов отслеживаемых авторов так много,
+        что страница набирается сразу. Глубина страницы не влияет
+        на время запроса.
+        """
+
+        table = self.model._meta.db_table
+        subscriptions = Subscription._meta.db_table
+        position_filter = ""
+        params = {"user_id": user_id, "limit": limit}
+        if position is not None:
+            position_filter = (
+                "AND (recipe.pub_date, recipe.id) < (%(pub_date)s, %(id)s)"
+            )
+            params["pub_date"], params["id"] = position
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT count(*) FROM {subscriptions} WHERE user_id = %s",
+                [user_id],
+            )
+            if cursor.fetchone()[0] >= TIMELINE_FANOUT_THRESHOLD:
+                sql = f"""
+                    SELECT recipe.id, recipe.pub_date
+                    FROM {table} recipe
+                    WHERE EXISTS (
+                        SELECT 1 FROM {subscriptions} subscription
+                        WHERE subscription.user_id = %(user_id)s
+                          AND subscription.author_id = recipe.author_id
+                    )
+                    {position_filter}
+                    ORDER BY recipe.pub_date DESC, recipe.id DESC
+                    LIMIT %(limit)s
+                """
+            else:
+                sql = f"""
+                    SELECT recipe.id, recipe.pub_date
+                    FROM {subscriptions} subscription
+                    CROSS JOIN LATERAL (
+                        SELECT recipe.id, recipe.pub_date
+                        FROM {table} recipe
+                        WHERE recipe.author_id = subscription.author_id
+                        {position_filter}
+                        ORDER BY recipe.pub_date DESC, recipe.id DESC
+                        LIMIT %(limit)s
+                    ) recipe
+                    WHERE subscription.user_id = %(user_id)s
+                    ORDER BY recipe.pub_date DESC, recipe.id DESC
+                    LIMIT %(limit)s
+                """
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def with_live_counters(self):
+        """Аннотирует количество добавлений рецепта в избранное
+        и в списки покупок, посчитанное по связанным таблицам."""
+
+        return self.annotate(
+            live_favorites_count=count_related(Favorite),
+            live_in_carts_count=count_related(ShoppingCart),
+        )
+
+    def counters_drift(self):
+        """Рецепты, у которых счетчики разошлись с фактическими
+        значениями."""
+
+        return self.with_live_counters().exclude(
+            favorites_count=F("live_favorites_count"),
+            in_carts_count=F("live_in_carts_count"),
+        )
+
+    def reconcile_counters(self):
+        """Пересчитывает счетчики рецептов с расхождениями.
+
+        Возвращает количество исправленных рецептов.
+        """
+
+        return self.model.objects.filter(
+            id__in=Subquery(self.counters_drift().values("id"))
+        ).update(
+            favorites_count=count_related(Favorite),
+            in_carts_count=count_related(ShoppingCart),
+        )
+
+
+def count_related(model):
+    """Подзапрос количества строк model, ссылающихся на рецепт."""
+
+    return Coalesce(
+        Subquery(
+            model.objects.filter(recipe=OuterRef("pk"))
+            .order_by()
+            .values("recipe")
+            .annotate(total=Count("id"))
+            .values("total")
+        ),
+        0,
+    )
+
+
+class RecipeManager(models.Manager.from_queryset(RecipeQuerySet)):
+    """Менеджер рецептов.
+
+    search_vector нужен только в SQL и не загружается в модели.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().defer("search_vector")
+
+
 class Recipe(models.Model):
     """
     Модель для хранения информации о рецептах.
@@ -75,12 +376,17 @@ class Recipe(models.Model):
     - author (User): Автор публикации (связь с моделью User).
     - name (str): Название рецепта.
     - image (ImageField): Изображение рецепта.
+    - image_renditions (dict): Пути к уменьшенным копиям изображения.
     - text (str): Текстовое описание.
     - ingredients (ManyToManyField): Список ингредиентов (связь с моделью
       Ingredient через промежуточную модель RecipeIngredient).
     - tags (ManyToManyField): Теги рецепта (связь с моделью Tag).
     - cooking_time (int): Время приготовления в минутах.
     - pub_date (datetime): Дата публикации.
+    - favorites_count (int): Количество добавлений в избранное.
+    - in_carts_count (int): Количество добавлений в списки покупок.
+    - search_vector (tsvector): Лексемы названия и описания для
+      полнотекстового поиска, заполняется триггером в базе.
     """
 
     author = models.ForeignKey(
@@ -97,6 +403,9 @@ class Recipe(models.Model):
     image = models.ImageField(
         upload_to="recipes/", verbose_name="Изображение рецепта"
     )
+    image_renditions = models.JSONField(
+        "Варианты изображения", default=dict, blank=True, editable=False
+    )
     text = models.TextField("Описание")
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -117,15 +426,69 @@ class Recipe(models.Model):
         ],
     )
     pub_date = models.DateTimeField("Дата публикации", auto_now_add=True)
+    favorites_count = models.PositiveIntegerField(
+        "Количество в избранном", default=0, editable=False
+    )
+    in_carts_count = models.PositiveIntegerField(
+        "Количество в списках покупок", default=0, editable=False
+    )
+    search_vector = SearchVectorField(
+        "Поисковый вектор", null=True, editable=False
+    )
+
+    objects = RecipeManager()
+
+    # Поля, которые меняются только отдельными запросами UPDATE:
+    # счетчики - через F(), варианты изображения - фоновой обработкой.
+    # save() существующего рецепта их не перезаписывает.
+    SEPARATELY_UPDATED_FIELDS = (
+        "favorites_count",
+        "in_carts_count",
+        "image_renditions",
+    )
 
     class Meta:
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
         ordering = ["-pub_date"]
+        indexes = [
+            models.Index(
+                fields=["-pub_date", "-id"], name="recipe_pub_date_id_idx"
+            ),
+            models.Index(
+                fields=["-favorites_count", "-pub_date", "-id"],
+                name="recipe_popular_idx",
+            ),
+            models.Index(
+                fields=["author", "pub_date", "id"],
+                name="recipe_author_pub_date_idx",
+            ),
+            GinIndex(
+                fields=["search_vector"], name="recipe_search_vector_idx"
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        """Сохраняет рецепт. При обновлении без update_fields пишет все
+        загруженные поля, кроме SEPARATELY_UPDATED_FIELDS, чтобы
+        не затереть значения, изменившиеся после загрузки рецепта."""
+
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            skipped = self.get_deferred_fields().union(
+                self.SEPARATELY_UPDATED_FIELDS
+            )
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in skipped
+                and field.attname not in skipped
+            ]
+        super().save(*args, **kwargs)
+
 
 class RecipeIngredient(models.Model):
     """
@@ -238,3 +601,450 @@ class ShoppingCart(models.Model):
             f"Рецепт {self.recipe.name} в списке покупок у"
             f" {self.user.username}"
         )
+
+
+class ShoppingCartIngredientManager(models.Manager):
+    """Менеджер агрегата списка покупок.
+
+    Суммы по ингредиентам обновляются инкрементально одним запросом
+    INSERT ... ON CONFLICT при изменении корзины или состава рецепта.
+    При вычитании удаляются только затронутые строки с нулевой суммой.
+    """
+
+    def live_totals(self):
+        """Текущий агрегат, посчитанный по корзинам и рецептам."""
+
+        return (
+            ShoppingCart.objects.filter(
+                recipe__recipe_ingredients__isnull=False
+            )
+            .values(
+                "user", ingredient=F("recipe__recipe_ingredients__ingredient")
+            )
+            .order_by()
+            .annotate(amount=models.Sum("recipe__recipe_ingredients__amount"))
+        )
+
+    def apply_recipe(self, recipe_id, sign=1, user_id=None):
+        """Добавляет (sign=1) или вычитает (sign=-1) ингредиенты рецепта
+        из списков покупок пользователей, у которых он в корзине."""
+
+        self.apply_recipes([recipe_id], sign, user_id)
+
+    def apply_recipes(self, recipe_ids, sign=1, user_id=None):
+        """То же, что apply_recipe, для нескольких рецептов одним
+        запросом."""
+
+        user_filter = "AND cart.user_id = %s" if user_id else ""
+        self._upsert(
+            f"""
+            SELECT cart.user_id, item.ingredient_id, %s * SUM(item.amount)
+            FROM {ShoppingCart._meta.db_table} cart
+            JOIN {RecipeIngredient._meta.db_table} item
+              ON item.recipe_id = cart.recipe_id
+            WHERE cart.recipe_id = ANY(%s::bigint[]) {user_filter}
+            GROUP BY cart.user_id, item.ingredient_id
+            """,
+            [sign, list(recipe_ids)] + ([user_id] if user_id else []),
+            subtract=sign < 0,
+        )
+
+    def apply_deltas(self, recipe_id, deltas):
+        """Меняет суммы в списках покупок пользователей, у которых
+        рецепт в корзине, на deltas - {id ингредиента: изменение
+        количества}. Используется при редактировании состава рецепта."""
+
+        deltas = {
+            ingredient_id: delta
+            for ingredient_id, delta in deltas.items()
+            if delta
+        }
+        if not deltas:
+            return
+        ingredient_ids, amounts = zip(*deltas.items())
+        self._upsert(
+            f"""
+            SELECT cart.user_id, delta.ingredient_id, SUM(delta.amount)
+            FROM {ShoppingCart._meta.db_table} cart
+            CROSS JOIN unnest(%s::bigint[], %s::integer[])
+              AS delta (ingredient_id, amount)
+            WHERE cart.recipe_id = %s
+            GROUP BY cart.user_id, delta.ingredient_id
+            """,
+            [list(ingredient_ids), list(amounts), recipe_id],
+            subtract=min(amounts) < 0,
+        )
+
+    def _upsert(self, select, params, subtract):
+        """Прибавляет к агрегату строки (user_id, ingredient_id, amount)
+        из select. Если среди них есть вычитания, удаляет затронутые
+        строки, сумма которых стала нулевой."""
+
+        table = self.model._meta.db_table
+        upsert = f"""
+            INSERT INTO {table} (user_id, ingredient_id, amount)
+            {select}
+            ON CONFLICT (user_id, ingredient_id)
+            DO UPDATE SET amount = {table}.amount + EXCLUDED.amount
+        """
+        with connection.cursor() as cursor:
+            if not subtract:
+                cursor.execute(upsert, params)
+                return
+            cursor.execute(
+                f"""
+                WITH touched AS ({upsert} RETURNING *)
+                SELECT user_id, ingredient_id FROM touched WHERE amount <= 0
+                """,
+                params,
+            )
+            emptied = cursor.fetchall()
+            if emptied:
+                user_ids, ingredient_ids = zip(*emptied)
+                cursor.execute(
+                    f"""
+                    DELETE FROM {table}
+                    WHERE (user_id, ingredient_id) IN (
+                        SELECT * FROM unnest(%s::bigint[], %s::bigint[])
+                    )
+                      AND amount <= 0
+                    """,
+                    [list(user_ids), list(ingredient_ids)],
+                )
+
+    def rebuild(self):
+        """Полностью пересчитывает агрегат по текущим корзинам."""
+
+        table = self.model._meta.db_table
+        self.all().delete()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {table} (user_id, ingredient_id, amount)
+                SELECT cart.user_id, item.ingredient_id, SUM(item.amount)
+                FROM {ShoppingCart._meta.db_table} cart
+                JOIN {RecipeIngredient._meta.db_table} item
+                  ON item.recipe_id = cart.recipe_id
+                GROUP BY cart.user_id, item.ingredient_id
+                """
+            )
+
+
+class ShoppingCartIngredient(models.Model):
+    """
+    Модель для хранения суммарного количества ингредиентов в списке
+    покупок пользователя.
+
+    Поля:
+    - user (User): Пользователь (связь с моделью User).
+    - ingredient (Ingredient): Ингредиент (связь с моделью Ingredient).
+    - amount (int): Суммарное количество ингредиента.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="shopping_cart_ingredients",
+        verbose_name="Пользователь",
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name="shopping_cart_ingredients",
+        verbose_name="Ингредиент",
+    )
+    amount = models.IntegerField("Количество")
+
+    objects = ShoppingCartIngredientManager()
+
+    class Meta:
+        verbose_name = "Ингредиент списка покупок"
+        verbose_name_plural = "Ингредиенты списка покупок"
+        constraints = (
+            models.UniqueConstraint(
+                fields=("user", "ingredient"),
+                name="unique_shopping_cart_ingredient",
+            ),
+        )
+
+    def __str__(self):
+        return f"{self.ingredient.name} - {self.amount}"
+
+
+# Наибольшее число недостающих ингредиентов при подборе рецептов.
+# В префикс рецепта попадают MATCH_PREFIX_SIZE самых редких ингредиентов.
+MATCH_MAX_MISSING = 3
+MATCH_PREFIX_SIZE = MATCH_MAX_MISSING + 1
+
+
+class RecipeIngredientSetManager(models.Manager):
+    """Менеджер индекса подбора рецептов по имеющимся ингредиентам.
+
+    Если в рецепте есть ингредиенты из набора и ему не хватает не больше
+    k ингредиентов, то хотя бы один из его k + 1 самых редких
+    ингредиентов есть в наборе. Рецепты без общих с набором
+    ингредиентов не подбираются, даже если они короче k + 1.
+    Ключи префикса кодируют ингредиент и его место по редкости внутри
+    рецепта, поэтому GIN-индекс отбирает кандидатов сразу для нужного k,
+    а полные массивы ингредиентов кандидатов проверяются в SQL.
+    Порядок редкости хранится в Ingredient.match_rank и меняется только
+    при полной перестройке, иначе префиксы разойдутся.
+    """
+
+    def refresh(self, recipe_ids=None):
+        """Пересчитывает строки индекса рецептов, все - без recipe_ids."""
+
+        table = self.model._meta.db_table
+        recipe_filter = (
+            "WHERE item.recipe_id = ANY(%s::bigint[])" if recipe_ids else ""
+        )
+        params = [MATCH_PREFIX_SIZE, MATCH_PREFIX_SIZE]
+        if recipe_ids:
+            params.append(list(recipe_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {table} (recipe_id, ingredient_ids, prefix_keys)
+                SELECT recipe_id, ingredient_ids,
+                       ARRAY(
+                           SELECT prefix.id * %s + prefix.position - 1
+                           FROM unnest(rarest[1:%s])
+                                WITH ORDINALITY prefix(id, position)
+                       )
+                FROM (
+                    SELECT item.recipe_id,
+                           array_agg(item.ingredient_id
+                                     ORDER BY item.ingredient_id)
+                               AS ingredient_ids,
+                           array_agg(item.ingredient_id
+                                     ORDER BY ingredient.match_rank
+                                     NULLS FIRST, ingredient.id) AS rarest
+                    FROM {RecipeIngredient._meta.db_table} item
+                    JOIN {Ingredient._meta.db_table} ingredient
+                      ON ingredient.id = item.ingredient_id
+                    {recipe_filter}
+                    GROUP BY item.recipe_id
+                ) recipe
+                ON CONFLICT (recipe_id) DO UPDATE
+                SET ingredient_ids = EXCLUDED.ingredient_ids,
+                    prefix_keys = EXCLUDED.prefix_keys
+                """,
+                params,
+            )
+        if recipe_ids:
+            self.filter(recipe_id__in=recipe_ids).exclude(
+                recipe__recipe_ingredients__isnull=False
+            ).delete()
+
+    def rebuild(self):
+        """Пересчитывает редкость ингредиентов и весь индекс."""
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {Ingredient._meta.db_table} ingredient
+                SET match_rank = ranked.rank
+                FROM (
+                    SELECT ingredient.id,
+                           row_number() OVER (
+                               ORDER BY count(item.id), ingredient.id
+                           ) AS rank
+                    FROM {Ingredient._meta.db_table} ingredient
+                    LEFT JOIN {RecipeIngredient._meta.db_table} item
+                      ON item.ingredient_id = ingredient.id
+                    GROUP BY ingredient.id
+                ) ranked
+                WHERE ranked.id = ingredient.id
+                """
+            )
+        self.all().delete()
+        self.refresh()
+
+    def match(self, ingredient_ids, max_missing, limit):
+        """Рецепты, в которых есть хотя бы один ингредиент из
+        ingredient_ids и которым не хватает не больше max_missing
+        ингредиентов.
+
+        Рецепты отсортированы по числу недостающих ингредиентов, затем
+        по доле имеющихся. Поиск идет по уровням от 0 недостающих и
+        останавливается, как только набралось limit рецептов.
+        Возвращает кортежи (id рецепта, число имеющихся ингредиентов,
+        id недостающих ингредиентов).
+        """
+
+        if max_missing > MATCH_MAX_MISSING:
+            raise ValueError(
+                f"max_missing не может быть больше {MATCH_MAX_MISSING}"
+            )
+        ingredient_ids = sorted(set(ingredient_ids))
+        for missing in range(max_missing + 1):
+            keys = [
+                pk * MATCH_PREFIX_SIZE + position
+                for pk in ingredient_ids
+                for position in range(missing + 1)
+            ]
+            rows = self.match_level(ingredient_ids, keys, missing, limit)
+            if len(rows) >= limit:
+                break
+        available = set(ingredient_ids)
+        return [
+            (
+                recipe_id,
+                matched,
+                [pk for pk in recipe_ingredients if pk not in available],
+            )
+            for recipe_id, recipe_ingredients, matched in rows
+        ]
+
+    def match_level(self, ingredient_ids, keys, missing, limit):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT recipe_id, ingredient_ids, matched
+                FROM (
+                    SELECT entry.recipe_id, entry.ingredient_ids,
+                           cardinality(entry.ingredient_ids) AS total,
+                           (
+                               SELECT count(*)
+                               FROM unnest(entry.ingredient_ids) id
+                               WHERE id = ANY(%(ingredient_ids)s::bigint[])
+                           ) AS matched
+                    FROM {self.model._meta.db_table} entry
+                    WHERE entry.prefix_keys && %(keys)s::bigint[]
+                ) candidate
+                WHERE matched > 0 AND total - matched <= %(missing)s
+                ORDER BY total - matched,
+                         matched::float / total DESC,
+                         recipe_id DESC
+                LIMIT %(limit)s
+                """,
+                {
+                    "ingredient_ids": ingredient_ids,
+                    "keys": keys,
+                    "missing": missing,
+                    "limit": limit,
+                },
+            )
+            return cursor.fetchall()
+
+
+class RecipeIngredientSet(models.Model):
+    """
+    Модель для хранения набора ингредиентов рецепта для подбора
+    рецептов по имеющимся ингредиентам.
+
+    Поля:
+    - recipe (Recipe): Рецепт (связь с моделью Recipe).
+    - ingredient_ids (list): Отсортированные id ингредиентов рецепта.
+    - prefix_keys (list): Ключи MATCH_PREFIX_SIZE самых редких
+      ингредиентов рецепта: id * MATCH_PREFIX_SIZE + место по редкости.
+      По ним построен GIN-индекс.
+    """
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="ingredient_set",
+        verbose_name="Рецепт",
+    )
+    ingredient_ids = ArrayField(
+        models.BigIntegerField(), verbose_name="Ингредиенты"
+    )
+    prefix_keys = ArrayField(
+        models.BigIntegerField(), verbose_name="Ключи префикса"
+    )
+
+    objects = RecipeIngredientSetManager()
+
+    class Meta:
+        verbose_name = "Набор ингредиентов рецепта"
+        verbose_name_plural = "Наборы ингредиентов рецептов"
+        indexes = [
+            GinIndex(
+                fields=["prefix_keys"], name="recipe_ingredient_prefix_idx"
+            )
+        ]
+
+    def __str__(self):
+        return f"Ингредиенты рецепта {self.recipe_id}"
+
+
+class RecipeSimilarityManager(models.Manager):
+    """Менеджер таблицы похожих рецептов.
+
+    Списки строит пакетное задание recipes.similarity. Изменения рецепта
+    и его избранного только отмечают строку устаревшей, пересчет идет
+    при следующем запуске задания.
+    """
+
+    def mark_stale(self, recipe_ids):
+        """Отмечает списки рецептов устаревшими, создавая строки
+        для рецептов, у которых их еще нет."""
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {self.model._meta.db_table}
+                    (recipe_id, similar_ids, stale_since)
+                SELECT id, '{{}}', clock_timestamp()
+                FROM {Recipe._meta.db_table}
+                WHERE id = ANY(%s::bigint[])
+                ON CONFLICT (recipe_id) DO UPDATE
+                SET stale_since = EXCLUDED.stale_since
+                """,
+                [list(recipe_ids)],
+            )
+
+    def get_similar_ids(self, recipe_id):
+        """Id похожих рецептов по убыванию сходства или None, если
+        список для рецепта еще не построен."""
+
+        return (
+            self.filter(recipe_id=recipe_id)
+            .values_list("similar_ids", flat=True)
+            .first()
+        )
+
+
+class RecipeSimilarity(models.Model):
+    """
+    Модель для хранения похожих рецептов.
+
+    Поля:
+    - recipe (Recipe): Рецепт (связь с моделью Recipe).
+    - similar_ids (list): Id похожих рецептов по убыванию сходства.
+    - stale_since (datetime): Когда список отмечен устаревшим,
+      пусто для актуальных списков.
+    """
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="similarity",
+        verbose_name="Рецепт",
+    )
+    similar_ids = ArrayField(
+        models.BigIntegerField(), verbose_name="Похожие рецепты"
+    )
+    stale_since = models.DateTimeField(
+        null=True, editable=False, verbose_name="Устарел"
+    )
+
+    objects = RecipeSimilarityManager()
+
+    class Meta:
+        verbose_name = "Похожие рецепты"
+        verbose_name_plural = "Похожие рецепты"
+        indexes = [
+            GinIndex(fields=["similar_ids"], name="recipe_similar_ids_idx"),
+            models.Index(
+                fields=["stale_since"],
+                name="recipe_similarity_stale_idx",
+                condition=models.Q(stale_since__isnull=False),
+            ),
+        ]
+
+    def __str__(self):
+        return f"Похожие на рецепт {self.recipe_id}"
@@ -0,0 +1,364 @@
+import csv
+import io
+import multiprocessing
+import random
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    RecipeIngredientSet,
+    ShoppingCart,
+    ShoppingCartIngredient,
+    Tag,
+)
+from users.models import Subscription, User
+
+# Размеры синтетического набора данных по умолчанию.
+DEFAULT_SIZES = {
+    "users": 100,
+    "tags": 10,
+    "ingredients": 2000,
+    "recipes": 1000,
+    "ingredients_per_recipe": 8,
+    "favorites": 5000,
+    "carts": 1000,
+    "subscriptions": 1000,
+}
+
+# Количество пользователей или рецептов в одной порции генерации.
+CHUNK_SIZE = 2000
+
+SYLLABLES = (
+    "ка", "ро", "ми", "ла", "то", "се", "ня", "бу", "ди", "мо",
+    "ре", "ту", "па", "лу", "ви", "на", "го", "че", "жа", "фи",
+)
+UNITS = ("г", "кг", "мл", "л", "шт.", "ст. л.", "ч. л.", "по вкусу")
+
+# Генератор, доступный дочерним процессам после fork.
+_seeder = None
+
+
+def random_word(rng, syllables=3):
+    return "".join(rng.choice(SYLLABLES) for _ in range(syllables))
+
+
+def copy_rows(model, fields, rows):
+    """Загружает строки в таблицу модели через COPY.
+
+    Возвращает количество загруженных строк.
+    """
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    buffer.seek(0)
+    columns = ", ".join(model._meta.get_field(name).column for name in fields)
+    with connection.cursor() as cursor:
+        cursor.cursor.copy_expert(
+            f"COPY {model._meta.db_table} ({columns}) "
+            f"FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+    return count
+
+
+class Popularity:
+    """Выбор объектов с вероятностью по закону Ципфа.
+
+    Порядок популярности задается случайной перестановкой, поэтому
+    популярные объекты не сосредоточены в начале диапазона id.
+    """
+
+    def __init__(self, rng, ids, exponent):
+        self.ids = list(ids)
+        rng.shuffle(self.ids)
+        self.cum_weights = list(
+            accumulate(
+                rank ** -exponent for rank in range(1, len(self.ids) + 1)
+            )
+        )
+
+    def choice(self, rng):
+        return rng.choices(self.ids, cum_weights=self.cum_weights)[0]
+
+    def sample(self, rng, count, exclude=None):
+        """До count различных объектов, популярные выпадают чаще."""
+
+        count = min(count, len(self.ids) - (exclude is not None))
+        chosen = set()
+        for _ in range(10):
+            if len(chosen) >= count:
+                break
+            chosen.update(
+                rng.choices(
+                    self.ids,
+                    cum_weights=self.cum_weights,
+                    k=count - len(chosen),
+                )
+            )
+            chosen.discard(exclude)
+        return sorted(chosen)[:count]
+
+
+class Seeder:
+    """Генератор синтетического набора данных для PostgreSQL.
+
+    Справочники, пользователи и рецепты создаются с явными id после
+    уже существующих записей, связи генерируются порциями, каждая со
+    своим генератором случайных чисел. Поэтому при одинаковых seed и
+    размерах данные не зависят от числа процессов.
+    """
+
+    def __init__(self, sizes=None, seed=0, exponent=1.1):
+        self.sizes = {**DEFAULT_SIZES, **(sizes or {})}
+        self.seed = seed
+        self.exponent = exponent
+        self.now = timezone.now()
+
+    def rng(self, *key):
+        return random.Random(":".join(map(str, (self.seed, *key))))
+
+    def allocate_ids(self, model, count):
+        start = (model.objects.aggregate(last=Max("id"))["last"] or 0) + 1
+        return range(start, start + count)
+
+    def seed_base(self):
+        rng = self.rng("base")
+        sizes = self.sizes
+        self.user_ids = self.allocate_ids(User, sizes["users"])
+        self.tag_ids = self.allocate_ids(Tag, sizes["tags"])
+        self.ingredient_ids = self.allocate_ids(
+            Ingredient, sizes["ingredients"]
+        )
+        self.recipe_ids = self.allocate_ids(Recipe, sizes["recipes"])
+
+        password = make_password("password")
+        counts = {}
+        counts["users"] = copy_rows(
+            User,
+            (
+                "id", "password", "is_superuser", "username", "first_name",
+                "last_name", "email", "is_staff", "is_active", "date_joined",
+            ),
+            (
+                (
+                    user_id, password, False, f"seed_user_{user_id}",
+                    random_word(rng, 2).capitalize(),
+                    random_word(rng, 3).capitalize(),
+                    f"seed_user_{user_id}@example.com", False, True,
+                    self.now,
+                )
+                for user_id in self.user_ids
+            ),
+        )
+        counts["tags"] = copy_rows(
+            Tag,
+            ("id", "name", "color", "slug"),
+            (
+                (
+                    tag_id,
+                    f"Тег {tag_id}",
+                    f"#{rng.randrange(0x1000000):06X}",
+                    f"tag-{tag_id}",
+                )
+                for tag_id in self.tag_ids
+            ),
+        )
+        counts["ingredients"] = copy_rows(
+            Ingredient,
+            ("id", "name", "measurement_unit"),
+            (
+                (
+                    ingredient_id,
+                    f"{random_word(rng, rng.randint(2, 4))} {ingredient_id}",
+                    rng.choice(UNITS),
+                )
+                for ingredient_id in self.ingredient_ids
+            ),
+        )
+        self.authors = Popularity(rng, self.user_ids, self.exponent)
+        counts["recipes"] = copy_rows(
+            Recipe,
+            (
+                "id", "author_id", "name", "image", "image_renditions",
+                "text", "cooking_time", "pub_date", "favorites_count",
+                "in_carts_count",
+            ),
+            (
+                (
+                    recipe_id,
+                    self.authors.choice(rng),
+                    f"{random_word(rng).capitalize()} {recipe_id}",
+                    "recipes/seed.jpg",
+                    "{}",
+                    " ".join(random_word(rng) for _ in range(10)),
+                    rng.randint(1, 180),
+                    self.now
+                    - timedelta(minutes=self.recipe_ids.stop - recipe_id),
+                    0,
+                    0,
+                )
+                for recipe_id in self.recipe_ids
+            ),
+        )
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                no_style(), [User, Tag, Ingredient, Recipe]
+            ):
+                cursor.execute(sql)
+
+        self.recipes = Popularity(rng, self.recipe_ids, self.exponent)
+        self.ingredients = Popularity(
+            rng, self.ingredient_ids, self.exponent
+        )
+        return counts
+
+    def get_tasks(self):
+        tasks = []
+        for name, ids in (
+            ("recipe_ingredients", self.recipe_ids),
+            ("recipe_tags", self.recipe_ids),
+            ("favorites", self.user_ids),
+            ("carts", self.user_ids),
+            ("subscriptions", self.user_ids),
+        ):
+            for start in range(0, len(ids), CHUNK_SIZE):
+                tasks.append((name, start))
+        return tasks
+
+    def run_task(self, task):
+        name, start = task
+        rng = self.rng(name, start)
+        generate = getattr(self, f"generate_{name}")
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL synchronous_commit TO OFF")
+            return name, generate(rng, start)
+
+    def get_count(self, rng, size):
+        """Число связей пользователя: экспоненциальное распределение
+        со средним, дающим заданный общий размер."""
+
+        average = self.sizes[size] / max(len(self.user_ids), 1)
+        return round(rng.expovariate(1 / average)) if average else 0
+
+    def generate_recipe_ingredients(self, rng, start):
+        per_recipe = self.sizes["ingredients_per_recipe"]
+        return copy_rows(
+            RecipeIngredient,
+            ("recipe_id", "ingredient_id", "amount"),
+            (
+                (recipe_id, ingredient_id, rng.randint(1, 500))
+                for recipe_id in self.recipe_ids[start:start + CHUNK_SIZE]
+                for ingredient_id in self.ingredients.sample(rng, per_recipe)
+            ),
+        )
+
+    def generate_recipe_tags(self, rng, start):
+        tag_ids = list(self.tag_ids)
+        return copy_rows(
+            Recipe.tags.through,
+            ("recipe_id", "tag_id"),
+            (
+                (recipe_id, tag_id)
+                for recipe_id in self.recipe_ids[start:start + CHUNK_SIZE]
+                for tag_id in rng.sample(
+                    tag_ids, min(len(tag_ids), rng.randint(1, 3))
+                )
+            ),
+        )
+
+    def generate_favorites(self, rng, start):
+        return self.generate_user_relations(
+            rng, start, Favorite, "recipe_id", self.recipes, "favorites"
+        )
+
+    def generate_carts(self, rng, start):
+        return self.generate_user_relations(
+            rng, start, ShoppingCart, "recipe_id", self.recipes, "carts"
+        )
+
+    def generate_subscriptions(self, rng, start):
+        return self.generate_user_relations(
+            rng,
+            start,
+            Subscription,
+            "author_id",
+            self.authors,
+            "subscriptions",
+        )
+
+    def generate_user_relations(
+        self, rng, start, model, field, popularity, size
+    ):
+        distinct = model is Subscription
+        return copy_rows(
+            model,
+            ("user_id", field),
+            (
+                (user_id, target_id)
+                for user_id in self.user_ids[start:start + CHUNK_SIZE]
+                for target_id in popularity.sample(
+                    rng,
+                    self.get_count(rng, size),
+                    exclude=user_id if distinct else None,
+                )
+            ),
+        )
+
+    def run(self, workers=1):
+        """Создает набор данных и возвращает число строк по таблицам."""
+
+        if connection.vendor != "postgresql":
+            raise ValueError("Генерация данных доступна только для PostgreSQL")
+        with transaction.atomic():
+            counts = self.seed_base()
+        tasks = self.get_tasks()
+        if workers > 1:
+            global _seeder
+            _seeder = self
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("fork"),
+            ) as executor:
+                results = list(executor.map(run_seed_task, tasks))
+        else:
+            results = [self.run_task(task) for task in tasks]
+        for name, count in results:
+            counts[name] = counts.get(name, 0) + count
+        with transaction.atomic():
+            ShoppingCartIngredient.objects.rebuild()
+            RecipeIngredientSet.objects.rebuild()
+            Recipe.objects.filter(
+                id__gte=self.recipe_ids.start, id__lt=self.recipe_ids.stop
+            ).reconcile_counters()
+        return counts
+
+
+def run_seed_task(task):
+    return _seeder.run_task(task)
+
+
+def seed_dataset(sizes=None, seed=0, workers=1, exponent=1.1):
+    """Заполняет базу синтетическими данными.
+
+    При одинаковых seed и размерах данные получаются одинаковыми.
+    Возвращает количество созданных строк по таблицам.
+    """
+
+    return Seeder(sizes, seed, exponent).run(workers)
@@ -0,0 +1,29 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .images import schedule_image_cleanup
+from .models import Recipe
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_replaced_image(sender, instance, **kwargs):
+    """Запоминает прежнее изображение, если рецепту загружено новое."""
+
+    if instance.pk and instance.image and not instance.image._committed:
+        instance._replaced_image = (
+            Recipe.objects.filter(pk=instance.pk)
+            .values_list("image", "image_renditions")
+            .first()
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def cleanup_replaced_image(sender, instance, **kwargs):
+    replaced = instance.__dict__.pop("_replaced_image", None)
+    if replaced is not None:
+        schedule_image_cleanup(*replaced)
+
+
+@receiver(post_delete, sender=Recipe)
+def cleanup_deleted_image(sender, instance, **kwargs):
+    schedule_image_cleanup(instance.image.name, instance.image_renditions)
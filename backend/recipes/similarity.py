@@ -0,0 +1,284 @@
+import csv
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.db import connection, connections, transaction
+from scipy import sparse
+
+from .models import Favorite, Recipe, RecipeIngredient, RecipeSimilarity
+
+# Сколько похожих рецептов хранится для каждого рецепта.
+SIMILAR_SIZE = 20
+
+# Вклад сходства по ингредиентам, избранному и тегам, в сумме 1.
+SIMILARITY_WEIGHTS = {"ingredients": 0.5, "favorites": 0.3, "tags": 0.2}
+
+# Ингредиенты и пользователи, которые есть больше чем у этого числа
+# рецептов, не участвуют в подборе кандидатов: иначе число пар
+# рецептов растет квадратично. Оценка кандидатов их учитывает.
+MAX_FEATURE_RECIPES = 2000
+
+# Количество рецептов в одной порции расчета.
+CHUNK_SIZE = 500
+
+
+def fetch_ids(sql, columns=1):
+    """Целочисленные столбцы результата запроса через COPY."""
+
+    buffer = io.StringIO()
+    with connection.cursor() as cursor:
+        cursor.cursor.copy_expert(f"COPY ({sql}) TO STDOUT", buffer)
+    values = np.fromstring(buffer.getvalue(), dtype=np.int64, sep=" ")
+    return values.reshape(-1, columns)
+
+
+class SimilarityIndex:
+    """Разреженные векторы признаков всех рецептов.
+
+    Признаки - ингредиенты, пользователи, добавившие рецепт в избранное,
+    и теги с весом idf. Каждая группа нормирована отдельно, поэтому
+    скалярное произведение векторов - взвешенная сумма косинусных мер
+    сходства по группам. Кандидатов дают общие редкие ингредиенты и
+    пользователи (candidates), частые признаки и теги (rescoring)
+    только добавляются к оценке кандидатов.
+    """
+
+    def __init__(self):
+        self.recipe_ids = fetch_ids(
+            f"SELECT id FROM {Recipe._meta.db_table} ORDER BY id"
+        ).ravel()
+        features = sparse.hstack(
+            [
+                self.load_features(
+                    RecipeIngredient, "ingredient_id", "ingredients"
+                ),
+                self.load_features(Favorite, "user_id", "favorites"),
+            ],
+            format="csr",
+        )
+        frequent = (
+            np.bincount(features.indices, minlength=features.shape[1])
+            > MAX_FEATURE_RECIPES
+        )
+        self.candidates = features[:, ~frequent]
+        self.transposed = self.candidates.T.tocsr()
+        self.rescoring = sparse.hstack(
+            [
+                features[:, frequent],
+                self.load_features(Recipe.tags.through, "tag_id", "tags"),
+            ],
+            format="csr",
+        )
+
+    def load_features(self, model, field, group):
+        pairs = fetch_ids(
+            f"SELECT recipe_id, {model._meta.get_field(field).column} "
+            f"FROM {model._meta.db_table}",
+            columns=2,
+        )
+        rows = np.searchsorted(self.recipe_ids, pairs[:, 0])
+        features, columns = np.unique(pairs[:, 1], return_inverse=True)
+        matrix = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, columns)),
+            shape=(len(self.recipe_ids), len(features)),
+        )
+        matrix.sum_duplicates()
+        matrix.data[:] = 1
+
+        frequency = np.bincount(matrix.indices, minlength=len(features))
+        weights = np.log(
+            len(self.recipe_ids) / np.maximum(frequency, 1), dtype=np.float32
+        )
+        matrix = matrix @ sparse.diags(weights)
+        matrix.eliminate_zeros()
+
+        norms = np.sqrt(matrix.multiply(matrix).sum(axis=1)).A1
+        scale = np.zeros_like(norms)
+        np.divide(
+            np.sqrt(SIMILARITY_WEIGHTS[group]),
+            norms,
+            out=scale,
+            where=norms > 0,
+        )
+        return (sparse.diags(scale) @ matrix).tocsr()
+
+    def get_rows(self, recipe_ids):
+        """Номера строк рецептов, id которых есть в индексе."""
+
+        rows = np.searchsorted(self.recipe_ids, recipe_ids)
+        rows = rows[rows < len(self.recipe_ids)]
+        return rows[np.isin(self.recipe_ids[rows], recipe_ids)]
+
+    def top_similar(self, rows):
+        """Похожие рецепты для рецептов с номерами строк rows.
+
+        Возвращает id рецептов, число похожих у каждого и id похожих
+        подряд, по убыванию сходства, при равенстве - сначала новые.
+        """
+
+        scores = (self.candidates[rows] @ self.transposed).tocsr()
+        sources = rows.repeat(np.diff(scores.indptr))
+        values = scores.data + np.asarray(
+            self.rescoring[sources]
+            .multiply(self.rescoring[scores.indices])
+            .sum(axis=1)
+        ).ravel()
+        values[scores.indices == sources] = -np.inf
+
+        counts = np.zeros(len(rows), dtype=np.int64)
+        similar = []
+        for position in range(len(rows)):
+            start, stop = scores.indptr[position:position + 2]
+            targets = scores.indices[start:stop]
+            row_values = values[start:stop]
+            best = np.flatnonzero(np.isfinite(row_values))
+            if len(best) > SIMILAR_SIZE:
+                threshold = np.partition(row_values[best], -SIMILAR_SIZE)
+                best = best[row_values[best] >= threshold[-SIMILAR_SIZE]]
+            best = best[np.lexsort((-targets[best], -row_values[best]))]
+            best = best[:SIMILAR_SIZE]
+            counts[position] = len(best)
+            similar.append(targets[best])
+        return (
+            self.recipe_ids[rows],
+            counts,
+            self.recipe_ids[np.concatenate(similar)],
+        )
+
+
+def get_targets(index, full):
+    """Рецепты для пересчета и отметки устаревания их списков.
+
+    Без full пересчитываются устаревшие списки, списки новых рецептов
+    и списки, в которых есть устаревшие рецепты.
+    """
+
+    table = RecipeSimilarity._meta.db_table
+    if full:
+        rows = np.arange(len(index.recipe_ids))
+    else:
+        recipe_ids = fetch_ids(
+            f"""
+            SELECT recipe.id
+            FROM {Recipe._meta.db_table} recipe
+            LEFT JOIN {table} similarity
+              ON similarity.recipe_id = recipe.id
+            WHERE similarity.recipe_id IS NULL
+               OR similarity.stale_since IS NOT NULL
+            UNION
+            SELECT recipe_id
+            FROM {table}
+            WHERE similar_ids && ARRAY(
+                SELECT recipe_id FROM {table}
+                WHERE stale_since IS NOT NULL
+            )
+            """
+        ).ravel()
+        rows = index.get_rows(np.sort(recipe_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT recipe_id, stale_since FROM {table} "
+            f"WHERE stale_since IS NOT NULL"
+        )
+        marks = dict(cursor.fetchall())
+    return rows, marks
+
+
+def save_similar(result, marks):
+    """Сохраняет списки похожих рецептов порции.
+
+    Отметка устаревания снимается, только если она не менялась с
+    момента чтения данных для расчета.
+    """
+
+    recipe_ids, counts, similar_ids = result
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for recipe_id, similar in zip(
+        recipe_ids.tolist(), np.split(similar_ids, np.cumsum(counts)[:-1])
+    ):
+        writer.writerow(
+            (
+                recipe_id,
+                "{" + ",".join(map(str, similar.tolist())) + "}",
+                marks.get(recipe_id, ""),
+            )
+        )
+    buffer.seek(0)
+
+    table = RecipeSimilarity._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE TEMPORARY TABLE recipe_similarity_batch "
+            "(recipe_id bigint, similar_ids bigint[], stale_since timestamptz)"
+            " ON COMMIT DROP"
+        )
+        cursor.cursor.copy_expert(
+            "COPY recipe_similarity_batch FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (recipe_id, similar_ids)
+            SELECT batch.recipe_id, batch.similar_ids
+            FROM recipe_similarity_batch batch
+            JOIN {Recipe._meta.db_table} recipe
+              ON recipe.id = batch.recipe_id
+            ON CONFLICT (recipe_id) DO UPDATE
+            SET similar_ids = EXCLUDED.similar_ids
+            """
+        )
+        cursor.execute(
+            f"""
+            UPDATE {table} similarity
+            SET stale_since = NULL
+            FROM recipe_similarity_batch batch
+            WHERE similarity.recipe_id = batch.recipe_id
+              AND similarity.stale_since = batch.stale_since
+            """
+        )
+
+
+def run_similarity_task(rows):
+    return _index.top_similar(rows)
+
+
+def build_similarity(full=False, workers=1, chunk_size=CHUNK_SIZE):
+    """Пересчитывает списки похожих рецептов.
+
+    Данные читаются одним снимком базы, порции рецептов считаются
+    в workers процессах. Без full пересчитываются только затронутые
+    изменениями списки (см. get_targets); списки, в которые изменение
+    добавило бы новый рецепт, обновятся при полном пересчете.
+    Возвращает количество пересчитанных рецептов.
+    """
+
+    if connection.vendor != "postgresql":
+        raise ValueError(
+            "Расчет похожих рецептов доступен только для PostgreSQL"
+        )
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        index = SimilarityIndex()
+        rows, marks = get_targets(index, full)
+    chunks = [
+        rows[start:start + chunk_size]
+        for start in range(0, len(rows), chunk_size)
+    ]
+    if workers > 1:
+        global _index
+        _index = index
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("fork"),
+        ) as executor:
+            for result in executor.map(run_similarity_task, chunks):
+                save_similar(result, marks)
+    else:
+        for chunk in chunks:
+            save_similar(index.top_similar(chunk), marks)
+    return len(rows)
@@ -0,0 +1,52 @@
+import hashlib
+import posixpath
+
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+
+
+def lock_content(name):
+    """Блокирует файл name до конца текущей транзакции.
+
+    Блокировку берут сохранение файла и удаление неиспользуемого
+    изображения, поэтому файл не удаляется, пока транзакция,
+    сохраняющая ссылку на него, не завершилась.
+    """
+
+    if connection.vendor != "postgresql":
+        return
+    key = int.from_bytes(
+        hashlib.sha256(name.encode()).digest()[:8], "big", signed=True
+    )
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", [key])
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище, называющее файлы по SHA-256 содержимого.
+
+    Одинаковые загрузки сохраняются в один файл, а содержимое файла
+    никогда не меняется, поэтому его можно кэшировать бессрочно.
+    Файл кладется в подкаталог по первым двум символам хэша в каталоге
+    исходного имени: recipes/ab/abcdef....jpg. Сохранение берет
+    блокировку lock_content, которая держится до конца транзакции.
+    """
+
+    def get_content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        hexdigest = digest.hexdigest()
+        extension = posixpath.splitext(name)[1].lower()
+        return posixpath.join(
+            posixpath.dirname(name),
+            hexdigest[:2],
+            f"{hexdigest}{extension}",
+        )
+
+    def _save(self, name, content):
+        name = self.get_content_name(name, content)
+        lock_content(name)
+        if self.exists(name):
+            return name
+        return super()._save(name, content)
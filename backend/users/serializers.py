@@ -4,10 +4,11 @@ from rest_framework.exceptions import ValidationError
 from rest_framework.fields import SerializerMethodField
 
 from .models import User
+from foodgram.metrics import TimedSerializerMixin
 from recipes.models import Recipe
 
 
-class CustomUserSerializer(UserSerializer):
+class CustomUserSerializer(TimedSerializerMixin, UserSerializer):
     """
     Переопределенный сериализатор пользователей с дополнительным полем
     подписки.
@@ -27,6 +28,8 @@ class CustomUserSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, "is_subscribed"):
+            return obj.is_subscribed
         user = self.context.get("request").user
         if user.is_anonymous:
             return False
@@ -91,13 +94,18 @@ class SubscriptionSerializer(CustomUserSerializer):
     def get_recipes(self, obj):
         from api.serializers import RecipeMinified
 
-        request = self.context.get("request")
-        limit = request.GET.get("recipes_limit")
-        recipes = obj.recipes.all()
-        if limit:
-            recipes = recipes[: int(limit)]
+        if hasattr(obj, "recipes_preview"):
+            recipes = obj.recipes_preview
+        else:
+            request = self.context.get("request")
+            limit = request.GET.get("recipes_limit")
+            recipes = obj.recipes.all()
+            if limit:
+                recipes = recipes[: int(limit)]
         serializer = RecipeMinified(recipes, many=True, read_only=True)
         return serializer.data
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, "recipes_count"):
+            return obj.recipes_count
         return Recipe.objects.filter(author=obj).count()
@@ -1,3 +1,5 @@
+from django.db import transaction
+from django.db.models import Count, Prefetch, Value, prefetch_related_objects
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import status
@@ -5,12 +7,21 @@ from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from api.bulk import (
+    BulkIdsSerializer,
+    add_relations,
+    bulk_response_data,
+    remove_relations,
+)
 from api.pagination import CustomPagination
+from api.timeline import invalidate_timeline
+from foodgram.async_views import AsyncViewSetMixin
 from .models import Subscription, User
 from .serializers import CustomUserSerializer, SubscriptionSerializer
+from recipes.models import Recipe
 
 
-class CustomUserViewSet(UserViewSet):
+class CustomUserViewSet(AsyncViewSetMixin, UserViewSet):
     """ViewSet для пользователей."""
 
     queryset = User.objects.all()
@@ -34,6 +45,7 @@ class CustomUserViewSet(UserViewSet):
             )
             serializer.is_valid(raise_exception=True)
             Subscription.objects.create(user=user, author=author)
+            transaction.on_commit(lambda: invalidate_timeline(user.id))
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         if request.method == "DELETE":
@@ -41,14 +53,62 @@ class CustomUserViewSet(UserViewSet):
                 Subscription, user=user, author=author
             )
             subscription.delete()
+            transaction.on_commit(lambda: invalidate_timeline(user.id))
             return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False,
+        methods=["post", "delete"],
+        url_path="subscribe",
+        permission_classes=[IsAuthenticated],
+    )
+    @transaction.atomic
+    def subscribe_bulk(self, request):
+        """Подписывает или отписывает на нескольких пользователей из
+        списка ids и возвращает результат для каждого id."""
+
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data["ids"]
+        user = request.user
+
+        if request.method == "POST":
+            _, results = add_relations(
+                Subscription,
+                user,
+                "author_id",
+                ids,
+                User.objects.all(),
+                excluded={user.id},
+            )
+        else:
+            _, results = remove_relations(Subscription, user, "author_id", ids)
+        transaction.on_commit(lambda: invalidate_timeline(user.id))
+        return Response(bulk_response_data(ids, results))
+
     @action(detail=False, permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
         """Возвращает список подписок пользователя."""
 
-        queryset = User.objects.filter(subscribers__user=request.user)
+        queryset = (
+            User.objects.filter(subscribers__user=request.user)
+            .annotate(
+                recipes_count=Count("recipes"), is_subscribed=Value(True)
+            )
+            .order_by("id")
+        )
         pages = self.paginate_queryset(queryset)
+
+        recipes = Recipe.objects.all()
+        limit = request.query_params.get("recipes_limit")
+        if limit and limit.isdigit():
+            recipes = Recipe.objects.latest_per_author(
+                [author.id for author in pages], int(limit)
+            )
+        prefetch_related_objects(
+            pages,
+            Prefetch("recipes", queryset=recipes, to_attr="recipes_preview"),
+        )
         serializer = SubscriptionSerializer(
             pages, many=True, context={"request": request}
         )